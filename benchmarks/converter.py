@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark of :class:`LiveblogScribbleliveConverter` with synthetic liveblog posts.
+
+Run from the repository root::
+
+    python benchmarks/converter.py --save baseline.json
+    python benchmarks/converter.py --compare baseline.json
+
+oEmbed lookups are answered locally, caches are cleared before every round and texts are
+unique, so the conversion itself is measured."""
+import argparse
+import asyncio
+import gc
+import json
+import os.path
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from livebridge_scribblelive import LiveblogScribbleliveConverter  # noqa: E402
+from livebridge_scribblelive.converters import item_cache, oembed_cache  # noqa: E402
+
+WORDS = ("Liveblog", "Bundestag", "Regierung", "Polizei", "Wetter", "Fußball", "Minister", "Berlin",
+         "heute", "meldet", "nach", "dem", "Spiel", "Einsatz", "Frankfurt", "Zeugen", "Straße")
+
+# items per post, paragraphs per text item and share of the posts converted
+SIZES = {
+    "small": (3, 1, 1),
+    "medium": (10, 3, 1),
+    "large": (30, 8, 1),
+    "huge": (80, 40, 0.1),
+}
+
+ITEM_TYPES = ("text", "quote", "image", "embed")
+
+EMBEDS = (
+    {"provider_name": "Twitter", "original_url": "https://twitter.com/dpa_live/status/{}"},
+    {"provider_name": "Instagram", "original_url": "https://www.instagram.com/p/{}/"},
+    {"provider_name": "YouTube", "original_id": "{}"},
+    {"provider_name": "Facebook",
+     "html": '<div class="fb-post" data-href="https://www.facebook.com/dpa/posts/{}"></div><script>FB.init()</script>'},
+    {"html": '<iframe src="https://www.dpa-video.com/{}.ihtml/player.html" allowfullscreen></iframe>'},
+)
+
+OEMBED_HTML = '<blockquote class="twitter-tweet"><p>Tweet</p></blockquote>\n<script async src="widgets.js"></script>'
+
+
+def _sentence(rnd, words=12):
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+
+def _text(rnd, paragraphs):
+    parts = []
+    for i in range(paragraphs):
+        if i % 3 == 1:
+            parts.append("<ul>{}</ul>".format("".join("<li>{}</li>".format(_sentence(rnd, 4)) for _ in range(4))))
+        elif i % 3 == 2:
+            parts.append('<p><b>{}</b> <a href="https://dpa.de/{}">{}</a> <strike>{}</strike> <span>{}</span></p>'.format(
+                _sentence(rnd, 3), rnd.randint(0, 10 ** 9), _sentence(rnd, 2), _sentence(rnd, 2), _sentence(rnd)))
+        else:
+            parts.append("<p>{} {}</p>".format(_sentence(rnd, 40), rnd.randint(0, 10 ** 9)))
+    return "".join(parts)
+
+
+def make_item(rnd, item_type, paragraphs=1):
+    """Returns a synthetic post item of **item_type**."""
+    uid = rnd.randint(0, 10 ** 12)
+    if item_type == "text":
+        item = {"item_type": "text", "text": _text(rnd, paragraphs)}
+    elif item_type == "quote":
+        item = {"item_type": "quote", "meta": {"quote": _sentence(rnd, 20), "credit": _sentence(rnd, 2)}}
+    elif item_type == "image":
+        item = {"item_type": "image", "meta": {
+            "caption": _sentence(rnd, 8), "credit": "dpa",
+            "media": {"renditions": {"viewImage": {"href": "https://images.example.com/{}.jpg".format(uid)}}}}}
+    else:
+        meta = {key: value.format(uid) for key, value in rnd.choice(EMBEDS).items()}
+        meta.update({"title": _sentence(rnd, 5), "description": _sentence(rnd, 15)})
+        item = {"item_type": "embed", "meta": meta}
+    return {"item": item, "type": item_type}
+
+
+def make_post(rnd, size, item_types=ITEM_TYPES):
+    """Returns a synthetic liveblog post of **size**, a key of :data:`SIZES`."""
+    items, paragraphs, _ = SIZES[size]
+    weights = {"text": 5, "quote": 1, "image": 2, "embed": 2}
+    # weighted pick, random.choices needs Python 3.6
+    weighted = [item_type for item_type in item_types for _ in range(weights[item_type])]
+    types = [rnd.choice(weighted) for _ in range(items)]
+    refs = [make_item(rnd, item_type, paragraphs) for item_type in types]
+    return {"_id": str(rnd.randint(0, 10 ** 12)), "groups": [{"id": "root"}, {"id": "main", "refs": refs}]}
+
+
+def _converter():
+    converter = LiveblogScribbleliveConverter()
+
+    async def fetch_oembed(api_url):
+        return OEMBED_HTML
+
+    converter._fetch_oembed = fetch_oembed
+    return converter
+
+
+def _clear_caches():
+    item_cache.clear()
+    oembed_cache.clear()
+
+
+async def _convert(posts):
+    converter = _converter()
+    for post in posts:
+        await converter.convert(post)
+
+
+def time_posts(loop, posts, rounds):
+    """Returns the best seconds of **rounds** conversions of **posts**."""
+    best = None
+    for _ in range(rounds):
+        _clear_caches()
+        gc.collect()
+        started = time.perf_counter()
+        loop.run_until_complete(_convert(posts))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_memory(loop, posts):
+    """Returns peak and total of the memory allocated while converting **posts**, in bytes."""
+    _clear_caches()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        loop.run_until_complete(_convert(posts))
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    _clear_caches()
+    return peak, current
+
+
+def run(posts=50, rounds=3, seed=1, sizes=tuple(SIZES)):
+    loop = asyncio.get_event_loop()
+    results = {"sizes": {}, "item_types": {}}
+    # warm up, e.g. the sanitizer is set up with the first text
+    rnd = random.Random(seed)
+    loop.run_until_complete(_convert([make_post(rnd, "medium") for _ in range(5)]))
+    for size in sizes:
+        rnd = random.Random(seed)
+        batch = [make_post(rnd, size) for _ in range(max(int(posts * SIZES[size][2]), 1))]
+        seconds = time_posts(loop, batch, rounds)
+        peak, retained = measure_memory(loop, batch)
+        results["sizes"][size] = {
+            "posts_per_second": len(batch) / seconds,
+            "ms_per_post": seconds * 1000 / len(batch),
+            "peak_kb": peak / 1024,
+            "retained_kb": retained / 1024,
+        }
+    for item_type in ITEM_TYPES:
+        rnd = random.Random(seed)
+        batch = [make_post(rnd, "medium", (item_type,)) for _ in range(posts)]
+        items = sum(len(post["groups"][1]["refs"]) for post in batch)
+        seconds = time_posts(loop, batch, rounds)
+        results["item_types"][item_type] = {"us_per_item": seconds * 10 ** 6 / items}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints changes against **baseline**, returns the list of regressions beyond **threshold**."""
+    regressions = []
+    checks = [("sizes", size, "ms_per_post") for size in results["sizes"]]
+    checks += [("sizes", size, "peak_kb") for size in results["sizes"]]
+    checks += [("item_types", item_type, "us_per_item") for item_type in results["item_types"]]
+    for group, name, metric in checks:
+        old = baseline.get(group, {}).get(name, {}).get(metric)
+        if not old:
+            continue
+        new = results[group][name][metric]
+        change = (new - old) / old
+        line = "{:<8} {:<12} {:>12.1f} -> {:>12.1f} {:>+8.1%}".format(name, metric, old, new, change)
+        if change > threshold:
+            regressions.append(line)
+            line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def report(results):
+    print("{:<8} {:>12} {:>12} {:>12} {:>12}".format("size", "posts/s", "ms/post", "peak KB", "retained KB"))
+    for size, res in results["sizes"].items():
+        print("{:<8} {:>12.1f} {:>12.2f} {:>12.1f} {:>12.1f}".format(
+            size, res["posts_per_second"], res["ms_per_post"], res["peak_kb"], res["retained_kb"]))
+    print()
+    print("{:<8} {:>12}".format("item", "us/item"))
+    for item_type, res in results["item_types"].items():
+        print("{:<8} {:>12.1f}".format(item_type, res["us_per_item"]))
+    print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--posts", type=int, default=50, help="posts per size and item type")
+    parser.add_argument("--rounds", type=int, default=3, help="rounds per measurement, the best is taken")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sizes", default=",".join(SIZES), help="comma separated sizes of posts")
+    parser.add_argument("--save", metavar="PATH", help="save results as baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare with saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as regression, default 0.2")
+    args = parser.parse_args(argv)
+
+    results = run(args.posts, args.rounds, args.seed, [size for size in args.sizes.split(",") if size])
+    results["python"] = platform.python_version()
+    results["posts"] = args.posts
+    report(results)
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print("{} regression(s) against {}".format(len(regressions), args.compare))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_url(url):
+    """Returns **url** with lowercased scheme and host, without fragment and trailing slash."""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+
+class TTLCache(object):
+    """Bounded in-memory cache, entries expire after **ttl** seconds and the least recently
+    used entries are evicted when **maxsize** is reached."""
+
+    def __init__(self, maxsize=1000, ttl=86400, negative_ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Returns the cached value of **key**, **None** if not cached or expired."""
+        entry = self._data.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value, *, negative=False):
+        """Caches **value** under **key**, with the shorter **negative_ttl** for failed lookups."""
+        ttl = self.negative_ttl if negative else self.ttl
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SqliteCache(object):
+    """Cache with the interface of :class:`TTLCache`, persisted in a sqlite database so entries
+    survive restarts. The least recently used entries are removed when **maxsize** is reached.
+    Values are stored as text."""
+
+    def __init__(self, path, maxsize=1000, ttl=86400, negative_ttl=300):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, "
+                           "expires REAL, accessed INTEGER)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        self._conn.commit()
+        # access counter for LRU eviction, accesses are written with the next change
+        self._tick = self._conn.execute("SELECT MAX(accessed) FROM cache").fetchone()[0] or 0
+        self._accessed = {}
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key):
+        """Returns the cached value of **key**, **None** if not cached or expired."""
+        now = time.time()
+        row = self._conn.execute("SELECT value, expires FROM cache WHERE key=?", (key,)).fetchone()
+        if row is not None:
+            if row[1] > now:
+                self._tick += 1
+                self._accessed[key] = self._tick
+                self.hits += 1
+                return row[0]
+            self._accessed.pop(key, None)
+            self._conn.execute("DELETE FROM cache WHERE key=?", (key,))
+            self._conn.commit()
+        self.misses += 1
+        return None
+
+    def set(self, key, value, *, negative=False):
+        """Caches **value** under **key**, with the shorter **negative_ttl** for failed lookups."""
+        now = time.time()
+        ttl = self.negative_ttl if negative else self.ttl
+        self._tick += 1
+        self._accessed.pop(key, None)
+        self._write_accessed()
+        self._conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (key, value, now + ttl, self._tick))
+        overflow = len(self) - self.maxsize
+        if overflow > 0:
+            self._conn.execute("DELETE FROM cache WHERE key IN "
+                               "(SELECT key FROM cache ORDER BY accessed LIMIT ?)", (overflow,))
+        self._conn.commit()
+
+    def _write_accessed(self):
+        if self._accessed:
+            self._conn.executemany("UPDATE cache SET accessed=? WHERE key=?",
+                                   [(tick, key) for key, tick in self._accessed.items()])
+            self._accessed.clear()
+
+    def clear(self):
+        self._accessed.clear()
+        self._conn.execute("DELETE FROM cache")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+
+def get_cache(path=None, **kwargs):
+    """Returns a :class:`SqliteCache` if **path** is given, otherwise a :class:`TTLCache`. Falls back
+    to the in-memory cache if the database can't be opened."""
+    if path:
+        try:
+            return SqliteCache(path, **kwargs)
+        except Exception as exc:
+            logger.error("Opening cache {} failed, using in-memory cache.".format(path))
+            logger.exception(exc)
+    return TTLCache(**kwargs)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+DEFAULT_SETTINGS = {
+    "breaker_error_rate": 0.5,
+    "breaker_min_requests": 10,
+    "breaker_window": 60,
+    "breaker_reset_timeout": 30,
+}
+
+
+class CircuitBreaker(object):
+    """Tracks the results of requests to one host. When at least **min_requests** requests were
+    sent within the last **window** seconds and the share of failed requests reaches
+    **error_rate**, the circuit opens and requests are rejected. After **reset_timeout** seconds
+    a single probe request is let through, which closes the circuit again if it succeeds."""
+
+    def __init__(self, error_rate=0.5, min_requests=10, window=60, reset_timeout=30):
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.opened = 0
+        self._results = deque()
+        self._opened_at = None
+        self._probe_at = None
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning("Circuit breaker changed from {} to {}".format(self.state, state))
+        self.state = state
+        if state == OPEN:
+            self.opened += 1
+            self._opened_at = time.monotonic()
+        self._results.clear()
+        self._probe_at = None
+
+    def allow(self):
+        """Returns **True** if a request may be sent."""
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # a probe without result is given up after reset_timeout
+            if self._probe_at is not None and now - self._probe_at < self.reset_timeout:
+                return False
+            self._probe_at = now
+        return True
+
+    def record(self, success):
+        """Records the result of a request."""
+        if self.state == HALF_OPEN:
+            self._set_state(CLOSED if success else OPEN)
+            return
+        now = time.monotonic()
+        self._results.append((now, success))
+        while self._results and now - self._results[0][0] > self.window:
+            self._results.popleft()
+        if self.state == CLOSED and len(self._results) >= self.min_requests:
+            failures = sum(1 for _, ok in self._results if not ok)
+            if failures / len(self._results) >= self.error_rate:
+                self._set_state(OPEN)
+
+    def stats(self):
+        failures = sum(1 for _, ok in self._results if not ok)
+        return {"state": self.state, "requests": len(self._results), "failures": failures, "opened": self.opened}
+
+
+_breakers = {}
+
+
+def get_circuit_breaker(host, settings={}):
+    """Returns the circuit breaker for **host**, which is shared process-wide. The settings of
+    the first caller are used.
+
+    :param host: key as returned by :func:`livebridge_scribblelive.connections.get_host_key`
+    :param settings: dictionary with keys of :data:`DEFAULT_SETTINGS`"""
+    if host not in _breakers:
+        opts = DEFAULT_SETTINGS.copy()
+        opts.update({k: v for k, v in settings.items() if k in DEFAULT_SETTINGS and v is not None})
+        _breakers[host] = CircuitBreaker(
+            error_rate=opts["breaker_error_rate"],
+            min_requests=opts["breaker_min_requests"],
+            window=opts["breaker_window"],
+            reset_timeout=opts["breaker_reset_timeout"])
+    return _breakers[host]
+
+
+def get_circuit_states():
+    """Returns the state of the circuit breakers of all hosts, for monitoring."""
+    return {host: breaker.stats() for host, breaker in _breakers.items()}
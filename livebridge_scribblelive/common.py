@@ -16,16 +16,102 @@
 import aiohttp
 import asyncio
 import json
+import random
 import time
 import logging
+import weakref
 from os.path import join as path_join
 from urllib.parse import urlencode, urljoin
+from livebridge_scribblelive.circuitbreaker import DEFAULT_SETTINGS as BREAKER_SETTINGS, get_circuit_breaker
+from livebridge_scribblelive.connections import DEFAULT_SETTINGS, get_host_key, registry
+from livebridge_scribblelive.ratelimit import get_rate_limiter, parse_retry_after
+from livebridge_scribblelive.retry import RetryPolicy
+from livebridge_scribblelive.tokens import TOKEN_LIFETIME, get_token_store, pending_logins
+from livebridge_scribblelive.uploads import Upload
 
 logger = logging.getLogger(__name__)
 
 class ScribbleLiveException(Exception):
+
+    def __init__(self, *args, status=None):
+        super().__init__(*args)
+        self.status = status
+
+
+class CircuitOpenException(ScribbleLiveException):
+    """Raised without sending a request, when the circuit breaker of the API host is open."""
     pass
 
+class TokenRefresher(object):
+    """Renews the auth token of one user at one endpoint **margin** seconds before it expires,
+    for all clients of this user. Clients are referenced weakly: livebridge doesn't close the
+    targets of removed bridges, so the refresh stops when no client is left, closed or garbage
+    collected."""
+
+    def __init__(self, margin, retry=60):
+        self.margin = margin
+        self.retry = retry
+        self.failures = 0
+        self.last_refresh = None
+        self.last_error = None
+        self._clients = weakref.WeakSet()
+        self._task = None
+
+    def add(self, client):
+        self._clients.add(client)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def discard(self, client):
+        self._clients.discard(client)
+        if not self._clients and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _get_auth_time(self):
+        return max([client.auth_time or 0 for client in self._clients] or [0])
+
+    async def _run(self):
+        while self._clients:
+            expires = self._get_auth_time() + TOKEN_LIFETIME - self.margin
+            # spread the refreshes of different users
+            await asyncio.sleep(max(expires - time.time() - random.uniform(0, self.margin / 10), 0))
+            if not await self._refresh():
+                await asyncio.sleep(self.retry)
+
+    async def _refresh(self):
+        client = next(iter(self._clients), None)
+        if client is None:
+            return True
+        try:
+            # a client may have logged in already
+            stored = client.token_store.get(client.endpoint, client.user)
+            if stored and stored[1] > self._get_auth_time():
+                token, auth_time = stored
+            elif await client._shared_login():
+                token, auth_time = client.auth_token, client.auth_time
+            else:
+                raise ScribbleLiveException("Token refresh for {} returned no token.".format(client.user))
+            for other in self._clients:
+                other.auth_token, other.auth_time = token, auth_time
+            self.failures = 0
+            self.last_refresh = time.time()
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.failures += 1
+            logger.error("Token refresh failed for {} [{}]".format(client.user, self.failures))
+            logger.exception(exc)
+            # the traceback would keep the client alive
+            self.last_error = exc.with_traceback(None)
+            return False
+
+
+# token refreshers by (endpoint, user)
+_refreshers = {}
+
+
 class ScribbleLiveClient(object):
 
     type = "scribble"
@@ -33,6 +119,7 @@ class ScribbleLiveClient(object):
     def __init__(self, *, config={}, **kwargs):
         self.auth_token = None
         self.auth_time = None
+        self._sessions = {}
 
         # config data
         auth_creds = config.get("auth", {})
@@ -43,73 +130,208 @@ class ScribbleLiveClient(object):
         self.endpoint =  config.get("endpoint", "https://apiv1.scribblelive.com")
         self.endpoint_v1 = config.get("endpoint_v1", "https://api.scribblelive.com/v1")
         self.target_id = "{}-{}-{}".format(self.type, self.user, self.event_id)
+        self.conn_settings = {key: config.get(key) for key in DEFAULT_SETTINGS}
+        self.breaker_settings = {key: config.get(key) for key in BREAKER_SETTINGS}
+        self.token_store = get_token_store(config.get("token_store"), config.get("token_store_path"))
+        self.token_refresh_margin = config.get("token_refresh_margin")
+        self.token_refresh_retry = config.get("token_refresh_retry", 60)
+        self.max_throttle_retries = config.get("max_throttle_retries", 3)
+        self.max_upload_size = config.get("max_upload_size", 10 * 1024 * 1024)
+        self.retry_policy = RetryPolicy(
+            retries=config.get("retries", 3),
+            base_delay=config.get("retry_base_delay", 0.5),
+            max_delay=config.get("retry_max_delay", 10),
+            deadline=config.get("retry_deadline", 30))
+        self._rate_limiter = get_rate_limiter(self.api_key, config.get("rate_limit"), config.get("rate_limit_burst"))
+
+        # background token refresh, shared with the clients of the same user
+        self._refresher = None
 
     async def _login(self):
-        # reset login data
-        self.auth_token = None
-        self.auth_time = None
         auth = aiohttp.BasicAuth(self.user, password=self.password, encoding="UTF-8")
         login_url = "{}/user?".format(self.endpoint)
         resp = await self._get(login_url, auth=auth)
         if resp.get("Auth"):
             self.auth_token = resp["Auth"]
             self.auth_time = time.time()
+            self.token_store.set(self.endpoint, self.user, self.auth_token, self.auth_time)
             logger.debug("Login successfull for {}/{}".format(self.user, self.event_id))
             return self.auth_token
+        # reset login data
+        self.auth_token = None
+        self.auth_time = None
+        self.token_store.delete(self.endpoint, self.user)
         return False
 
     async def _check_login(self):
         diff = (time.time()-self.auth_time) if self.auth_token else 0
-        if self.auth_token and diff < 3600:
+        if self.auth_token and diff < TOKEN_LIFETIME:
             return self.auth_token
-        return await self._login()
+        # use token of other targets with same user
+        stored = self.token_store.get(self.endpoint, self.user)
+        if stored:
+            self.auth_token, self.auth_time = stored
+            token = self.auth_token
+        else:
+            token = await self._shared_login()
+        self._start_token_refresh()
+        return token
+
+    async def _shared_login(self):
+        """Logs in, concurrent callers with the same endpoint and user share one login, also
+        across clients."""
+        key = (self.endpoint, self.user)
+        future = pending_logins.get(key)
+        if future is None or future.done():
+            future = asyncio.ensure_future(self._login())
+            pending_logins[key] = future
+            future.add_done_callback(lambda done: self._login_done(key, done))
+        token = await asyncio.shield(future)
+        if token and token != self.auth_token:
+            # login was sent by another client
+            stored = self.token_store.get(self.endpoint, self.user)
+            self.auth_token, self.auth_time = stored if stored and stored[0] == token else (token, time.time())
+        elif not token:
+            self.auth_token = None
+            self.auth_time = None
+        return token
+
+    @staticmethod
+    def _login_done(key, future):
+        if pending_logins.get(key) is future:
+            del pending_logins[key]
+
+    def _start_token_refresh(self):
+        if self.token_refresh_margin and self.auth_token and self._refresher is None:
+            key = (self.endpoint, self.user)
+            if key not in _refreshers:
+                _refreshers[key] = TokenRefresher(self.token_refresh_margin, self.token_refresh_retry)
+            self._refresher = _refreshers[key]
+            self._refresher.add(self)
+
+    def get_refresh_state(self):
+        """Returns state of the background token refresh for monitoring."""
+        refresher = self._refresher
+        return {
+            "enabled": bool(self.token_refresh_margin),
+            "auth_time": self.auth_time,
+            "last_refresh": refresher.last_refresh if refresher else None,
+            "failures": refresher.failures if refresher else 0,
+            "last_error": repr(refresher.last_error) if refresher and refresher.last_error else None,
+        }
 
-    def _add_url_params(self, url):
+    def _get_session(self, url):
+        """Returns the long-lived HTTP session for the host of **url**, created on first use.
+        The session uses the connector shared process-wide for this host."""
+        host = get_host_key(url)
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            if session is None:
+                connector = registry.acquire(host, self.conn_settings)
+            else:
+                # the reference of the closed session is still held
+                connector = registry.get(host, self.conn_settings)
+            session = aiohttp.ClientSession(connector=connector, connector_owner=False)
+            self._sessions[host] = session
+        return session
+
+    async def close(self):
+        """Stops the token refresh, closes the HTTP sessions and releases the shared connectors."""
+        if self._refresher is not None:
+            self._refresher.discard(self)
+            self._refresher = None
+        sessions, self._sessions = self._sessions, {}
+        for host, session in sessions.items():
+            if not session.closed:
+                await session.close()
+            await registry.release(host)
+
+    def _add_url_params(self, url, *, with_auth=True):
         params = [
             ("Token", self.api_key),
             ("format", "json")
         ]
-        if self.auth_token:
+        if self.auth_token and with_auth:
             params.append(("Auth", self.auth_token))
         return url+("" if url[-1] == "?" else "&")+urlencode(params)
 
-    async def _get(self, url, *, auth=None, status=200):
-        url = self._add_url_params(url)
-        async with aiohttp.ClientSession(auth=auth) as session:
-            async with session.get(url) as resp:
-                if resp.status == status:
-                    return await resp.json()
-                else:
+    async def _request(self, method, url, *, auth=None, status=200, data=None, idempotent=True, **kwargs):
+        """Sends request with **method** to **url** and returns the JSON response. Requests wait
+        for the rate limiter of the API key and are repeated when the API answers with status 429.
+        Failed requests are retried according to the retry policy, requests which are not
+        **idempotent** only when they couldn't be sent. Requests to hosts with an open circuit
+        breaker fail without being sent. A callable **data** is called for every
+        attempt to build the request body."""
+        host = get_host_key(url)
+        breaker = get_circuit_breaker(host, self.breaker_settings)
+        started = time.monotonic()
+        attempt = 0
+        throttled = 0
+        while True:
+            # checked first, so requests to an open circuit neither wait for nor use the rate limit
+            if not breaker.allow():
+                raise CircuitOpenException("Scribblelive {} request [{}] rejected, circuit for {} is open".format(
+                    method.upper(), url, host))
+            await self._rate_limiter.acquire()
+            body = data() if callable(data) else data
+            recorded = False
+            try:
+                async with getattr(self._get_session(url), method)(url, data=body, auth=auth, **kwargs) as resp:
+                    breaker.record(resp.status < 500)
+                    recorded = True
+                    if resp.status == status:
+                        return await resp.json()
+                    elif resp.status == 429 and throttled < self.max_throttle_retries:
+                        self._rate_limiter.pause(parse_retry_after(resp.headers.get("Retry-After")))
+                        throttled += 1
+                        continue
                     logger.error(await resp.text())
-                    raise ScribbleLiveException("Scribblelive GET request [{}] failed with status {}".format(url, resp.status))
+                    raise ScribbleLiveException("Scribblelive {} request [{}] failed with status {}".format(
+                        method.upper(), url, resp.status), status=resp.status)
+            except Exception as exc:
+                if not recorded and isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError)):
+                    breaker.record(False)
+                delay = None
+                if self.retry_policy.is_retryable(exc, idempotent):
+                    delay = self.retry_policy.get_delay(attempt, started)
+                if delay is None:
+                    raise
+                logger.warning("Retrying Scribblelive {} request [{}] in {:.2f}s: {!r}".format(
+                    method.upper(), url, delay, exc))
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _get(self, url, *, auth=None, status=200):
+        url = self._add_url_params(url, with_auth=auth is None)
+        return await self._request("get", url, auth=auth, status=status)
 
     async def _post(self, url, images=[], content="", *, auth=None, status=200):
-        url = self._add_url_params(url)
-        data = {}
+        url = self._add_url_params(url, with_auth=auth is None)
+        upload = None
         if images:
-            data = aiohttp.FormData()
-            data.add_field("file",
-                open(images[0], "rb"),
-                content_type='multipart/form-data')
-            data.add_field("content", content)
-        elif content:
-            data["content"] = content
-        async with aiohttp.ClientSession(auth=auth) as session:
-            async with session.post(url, data=data) as resp:
-                if resp.status == status:
-                    return await resp.json()
-                else:
-                    logger.error(await resp.text())
-                    raise ScribbleLiveException("Scribblelive POST request [{}] failed with status {}".format(url, resp.status))
+            if len(images) > 1:
+                logger.warning("Scribblelive posts can have only one image, {} ignored.".format(len(images)-1))
+            upload = Upload(images[0])
+            if await upload.prepare() > self.max_upload_size:
+                raise ScribbleLiveException("Image {} exceeds upload limit of {} bytes".format(
+                    upload.filename, self.max_upload_size))
+
+        def get_data():
+            data = {}
+            if upload:
+                data = aiohttp.FormData()
+                data.add_field("file",
+                    upload.get_payload("multipart/form-data"),
+                    filename=upload.filename,
+                    content_type='multipart/form-data')
+                data.add_field("content", content)
+            elif content:
+                data["content"] = content
+            return data
+        return await self._request("post", url, auth=auth, status=status, data=get_data, idempotent=False)
 
     async def _put(self, url, content="", images=[], *, auth=None, status=200):
-        url = self._add_url_params(url)
+        url = self._add_url_params(url, with_auth=auth is None)
         data = json.dumps({"ThreadId": int(self.event_id), "Content": content})
         headers = {"Content-Type": "application/json", "Accept": "application/json"}
-        async with aiohttp.ClientSession(auth=auth, headers=headers) as session:
-            async with session.put(url, data=data) as resp:
-                if resp.status == status:
-                    return await resp.json()
-                else:
-                    logger.error(await resp.text())
-                    raise ScribbleLiveException("Scribblelive PUT request [{}] failed with status {}".format(url, resp.status))
+        return await self._request("put", url, auth=auth, status=status, data=data, headers=headers)
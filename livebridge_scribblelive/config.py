@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+
+OEMBED_CACHE = {
+    "path": os.environ.get("LB_SCRIBBLE_OEMBED_CACHE"),
+    "maxsize": int(os.environ.get("LB_SCRIBBLE_OEMBED_CACHE_SIZE", 2000)),
+    "ttl": int(os.environ.get("LB_SCRIBBLE_OEMBED_CACHE_TTL", 86400)),
+    "negative_ttl": int(os.environ.get("LB_SCRIBBLE_OEMBED_CACHE_NEGATIVE_TTL", 300)),
+}
+
+ITEM_CACHE = {
+    "maxsize": int(os.environ.get("LB_SCRIBBLE_ITEM_CACHE_SIZE", 5000)),
+    "ttl": int(os.environ.get("LB_SCRIBBLE_ITEM_CACHE_TTL", 86400)),
+}
+
+EMBED_CONCURRENCY = int(os.environ.get("LB_SCRIBBLE_EMBED_CONCURRENCY", 5))
+
+CONVERT_PROCESSES = int(os.environ.get("LB_SCRIBBLE_CONVERT_PROCESSES", 0))
+
+THREADS = int(os.environ.get("LB_SCRIBBLE_THREADS", 4))
+OFFLOAD_SIZE = int(os.environ.get("LB_SCRIBBLE_OFFLOAD_SIZE", 50000))
+
+IMAGE_UPLOAD = os.environ.get("LB_SCRIBBLE_IMAGE_UPLOAD", "").lower() in ("1", "true", "yes")
+IMAGE_MAX_SIZE = int(os.environ.get("LB_SCRIBBLE_IMAGE_MAX_SIZE", 10 * 1024 * 1024))
+IMAGE_TIMEOUT = int(os.environ.get("LB_SCRIBBLE_IMAGE_TIMEOUT", 30))
+
+IMAGE_CACHE = {
+    "path": os.environ.get("LB_SCRIBBLE_IMAGE_CACHE"),
+    "max_size": int(os.environ.get("LB_SCRIBBLE_IMAGE_CACHE_SIZE", 500 * 1024 * 1024)),
+}
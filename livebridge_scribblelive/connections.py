@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import aiohttp
+import logging
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_SETTINGS = {
+    "conn_limit": 100,
+    "conn_limit_per_host": 0,
+    "dns_cache_ttl": 10,
+    "keepalive_timeout": 30,
+}
+
+
+def get_host_key(url):
+    """Returns the key under which connections to the host of **url** are pooled."""
+    parts = urlsplit(url)
+    return "{}://{}".format(parts.scheme, parts.netloc)
+
+
+class ConnectorRegistry(object):
+    """Process-wide, reference counted pool of :class:`aiohttp.TCPConnector` objects, one per host.
+
+    All clients talking to the same host share one connector, so the number of sockets depends
+    on the number of hosts and not on the number of Scribblelive events."""
+
+    def __init__(self):
+        self._connectors = {}
+        self._refs = {}
+
+    def acquire(self, host, settings={}):
+        """Returns the connector for **host** and increases its reference count. The settings of the
+        first caller are used to create the connector.
+
+        :param host: key as returned by :func:`get_host_key`
+        :param settings: dictionary with keys of :data:`DEFAULT_SETTINGS`
+        :returns: :class:`aiohttp.TCPConnector`"""
+        connector = self.get(host, settings)
+        self._refs[host] += 1
+        return connector
+
+    def get(self, host, settings={}):
+        """Returns the connector for **host** without changing its reference count, for callers
+        already holding a reference. A closed connector is replaced."""
+        connector = self._connectors.get(host)
+        if connector is None or connector.closed:
+            opts = DEFAULT_SETTINGS.copy()
+            opts.update({k: v for k, v in settings.items() if k in DEFAULT_SETTINGS and v is not None})
+            connector = aiohttp.TCPConnector(
+                limit=opts["conn_limit"],
+                limit_per_host=opts["conn_limit_per_host"],
+                ttl_dns_cache=opts["dns_cache_ttl"],
+                keepalive_timeout=opts["keepalive_timeout"])
+            self._connectors[host] = connector
+            self._refs.setdefault(host, 0)
+            logger.debug("Created connector for {} with {}".format(host, opts))
+        return connector
+
+    async def release(self, host):
+        """Decreases the reference count of the connector for **host**, closes it when unused."""
+        if host not in self._refs:
+            return
+        self._refs[host] -= 1
+        if self._refs[host] <= 0:
+            connector = self._connectors.pop(host)
+            del self._refs[host]
+            if not connector.closed:
+                # close() is only awaitable in newer aiohttp versions
+                closing = connector.close()
+                if closing is not None:
+                    await closing
+            logger.debug("Closed connector for {}".format(host))
+
+    def stats(self):
+        """Returns the reference count of every pooled host."""
+        return dict(self._refs)
+
+
+registry = ConnectorRegistry()
@@ -14,73 +14,249 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import aiohttp
-import bleach
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import os.path
 import re
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlencode
 from livebridge.base import BaseConverter, ConversionResult
+from livebridge_scribblelive import config
+from livebridge_scribblelive.cache import TTLCache, get_cache, normalize_url
+from livebridge_scribblelive.embeds import EmbedRegistry
+from livebridge_scribblelive.executor import run_blocking
+from livebridge_scribblelive.images import get_image_cache, link_file
+from livebridge_scribblelive.sanitizer import clean_text
+from livebridge_scribblelive.uploads import CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
+# shared by all converter instances, livebridge creates one per post
+oembed_cache = get_cache(**config.OEMBED_CACHE)
+# running oEmbed lookups by cache key
+pending_oembeds = {}
+# converted HTML of single post items
+item_cache = TTLCache(**config.ITEM_CACHE)
+# downloaded images, None if not configured
+image_cache = get_image_cache(**config.IMAGE_CACHE)
+
+CACHED_ITEM_TYPES = ("text", "quote", "image", "embed")
+FILE_EXT = {
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/png": ".png",
+}
+
+_facebook_script_re = re.compile(r'<script>.*<\/script>$')
+_script_re = re.compile(r'<script[^<]*<\/script>$', flags=re.M)
+
+# providers of embeds, further providers can be registered
+embed_providers = EmbedRegistry()
+embed_providers.register("twitter", "_convert_twitter_embed", provider_name="Twitter")
+embed_providers.register("youtube", "_prepare_youtube_embed", provider_name="YouTube", with_text=False)
+embed_providers.register("facebook", "_convert_facebook_embed", provider_name="Facebook")
+embed_providers.register("instagram", "_convert_instagram_embed", provider_name="Instagram")
+embed_providers.register("instagram", "_convert_instagram_html", html=[re.escape('class="instagram-media"')])
+embed_providers.register("youtube", "_prepare_youtube_embed", html=[re.escape("youtube.com"), "embedly-embed"])
+embed_providers.register("youtube", "_prepare_youtube_embed", html=[re.escape("youtube.com/embed")])
+embed_providers.register("iframe", "_convert_iframe_embed", html=["<iframe "], fallback=True)
+
+_session = None
+_process_pool = None
+
+
+def get_session():
+    """Returns the HTTP session shared by all converter instances, a new one is created when
+    the event loop changed."""
+    global _session
+    loop = asyncio.get_event_loop()
+    if _session is None or _session[1].closed or _session[0] is not loop:
+        _session = (loop, aiohttp.ClientSession())
+    return _session[1]
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session[1].closed:
+        await _session[1].close()
+    _session = None
+
+
+def get_process_pool(workers):
+    """Returns the process pool for rendering post items, shared by all converter instances."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=workers)
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown()
+    _process_pool = None
+
+
+def discard_process_pool(pool):
+    """Drops the broken process **pool**, the next call of :func:`get_process_pool` starts a new one."""
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+    pool.shutdown(wait=False)
+
+
+def render_items(converter_class, items):
+    """Renders **items** with a new instance of **converter_class**, runs in the worker processes.
+    Returns the converted HTML or the exception for each item."""
+    converter = converter_class()
+    results = []
+    for item in items:
+        try:
+            results.append(converter._render_item(item))
+        except Exception as exc:
+            results.append(exc)
+    return results
+
+
 class LiveblogScribbleliveConverter(BaseConverter):
 
     source = "liveblog"
     target = "scribble"
 
-    async def _get_instagram_embed(self, insta_url):
-        """Resolve embed code via Instagram API."""
+    embed_concurrency = config.EMBED_CONCURRENCY
+    image_upload = config.IMAGE_UPLOAD
+    image_max_size = config.IMAGE_MAX_SIZE
+    image_timeout = config.IMAGE_TIMEOUT
+    convert_processes = config.CONVERT_PROCESSES
+    offload_size = config.OFFLOAD_SIZE
+
+    async def _fetch_oembed(self, api_url):
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        async with aiohttp.ClientSession(conn_timeout=10, headers=headers) as session:
+            async with session.get(api_url) as response:
+                api_resp = await response.json()
+                return api_resp.get("html", None)
+
+    async def _get_oembed(self, provider, api_url, url):
+        """Resolve embed code via oEmbed API of **provider**, responses are cached. Concurrent
+        lookups of the same URL share one request."""
+        key = "{}:{}".format(provider, normalize_url(url))
+        html = oembed_cache.get(key)
+        if html is not None:
+            return html
+        if key not in pending_oembeds:
+            pending_oembeds[key] = asyncio.ensure_future(self._resolve_oembed(provider, api_url, key))
+            pending_oembeds[key].add_done_callback(lambda fut: pending_oembeds.pop(key, None))
+        return await asyncio.shield(pending_oembeds[key])
+
+    async def _resolve_oembed(self, provider, api_url, key):
+        html = None
         try:
-            api_url = "https://api.instagram.com/oembed/?{}".format(urlencode({"url": insta_url}))
-            headers = {"Content-Type": "application/json", "Accept": "application/json"}
-            async with aiohttp.ClientSession(conn_timeout=10, headers=headers) as session:
-                async with session.get(api_url) as response:
-                    api_resp = await response.json()
-                    return api_resp.get("html", None)
+            html = await self._fetch_oembed(api_url)
         except Exception as exc:
-            logger.error("Fatal error when requesting instagram emebd.")
+            logger.error("Fatal error when requesting {} emebd.".format(provider))
             logger.exception(exc)
-        return ""
+        oembed_cache.set(key, html or "", negative=not html)
+        return html or ""
+
+    async def _get_instagram_embed(self, insta_url):
+        """Resolve embed code via Instagram API."""
+        api_url = "https://api.instagram.com/oembed/?{}".format(urlencode({"url": insta_url}))
+        return await self._get_oembed("instagram", api_url, insta_url)
 
     async def _get_twitter_embed(self, twitter_url):
         """Resolve embed code via Twitter API."""
-        try:
-            api_url = "https://publish.twitter.com/oembed?{}".format(urlencode({"url": twitter_url, "dnt" : "1"}))
-            headers = {"Content-Type": "application/json", "Accept": "application/json"}
-            async with aiohttp.ClientSession(conn_timeout=10, headers=headers) as session:
-                async with session.get(api_url) as response:
-                    api_resp = await response.json()
-                    return api_resp.get("html", None)
-        except Exception as exc:
-            logger.error("Fatal error when requesting twitter emebd.")
-            logger.exception(exc)
-        return ""
+        api_url = "https://publish.twitter.com/oembed?{}".format(urlencode({"url": twitter_url, "dnt" : "1"}))
+        return await self._get_oembed("twitter", api_url, twitter_url)
 
-    async def _convert_image_inline(self, item):
+    def _render_image_inline(self, item):
         logger.debug("CONVERTING IMAGE INLINE")
-        content = ""
-        tmp_path = None
+        parts = []
         try:
             # handle image
-            image_data = item["item"]["meta"]["media"]["renditions"]["viewImage"]
+            meta = item["item"]["meta"]
+            image_data = meta["media"]["renditions"]["viewImage"]
             if image_data.get("href"):
-                content += '<img src="{}" />'.format(image_data["href"])
+                parts.append('<img src="{}" />'.format(image_data["href"]))
             # handle text
-            caption = item["item"]["meta"]["caption"]
+            caption = meta["caption"]
             if caption:
-                content += "<br>{} ".format(caption)
-            credit = item["item"]["meta"]["credit"]
+                parts.append("<br>{} ".format(caption))
+            credit = meta["credit"]
             if credit:
-                content += "<i>({})</i>".format(credit)
-            # wrap in div
-            if content:
-                content = "<div>{}</div>".format(content)
-            else:
-                # assure at last a whitespace!
-                content += " "
+                parts.append("<i>({})</i>".format(credit))
         except Exception as e:
             logger.error("Fatal error when converting image.")
             logger.exception(e)
-        return content, tmp_path
+            return "".join(parts)
+        # wrap in div
+        if parts:
+            return "<div>{}</div>".format("".join(parts))
+        # assure at last a whitespace!
+        return " "
+
+    async def _convert_image_inline(self, item):
+        return self._render_image_inline(item), None
+
+    async def _download_image(self, data):
+        """Streams the image rendition **data** into a temporary file and returns its path.
+        The file is removed again, if the download fails, takes longer than **image_timeout**
+        seconds or exceeds **image_max_size** bytes. Images already in the image cache are
+        not downloaded again."""
+        basename = os.path.basename(data["media"])
+        file_ext = "" if os.path.splitext(basename)[1] else FILE_EXT.get(data.get("mimetype"), "")
+        filepath = os.path.join(
+            tempfile.gettempdir(), "{}-{}{}".format(str(uuid.uuid4())[:8], basename, file_ext))
+        digest = image_cache.get(data["href"]) if image_cache is not None else None
+        if digest is not None:
+            await run_blocking(link_file, image_cache.get_path(digest), filepath)
+            image_cache.track(filepath, digest, data["href"])
+            return filepath
+        image_file = None
+        content_hash = hashlib.sha256()
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.image_timeout)
+            async with get_session().get(data["href"], timeout=timeout) as resp:
+                if resp.status != 200:
+                    raise Exception("Downloading image {} failed: {}".format(data["href"], resp.status))
+                if (resp.content_length or 0) > self.image_max_size:
+                    raise Exception("Image {} exceeds {} bytes.".format(data["href"], self.image_max_size))
+                image_file = await run_blocking(open, filepath, "wb")
+                size = 0
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.image_max_size:
+                        raise Exception("Image {} exceeds {} bytes.".format(data["href"], self.image_max_size))
+                    content_hash.update(chunk)
+                    await run_blocking(image_file.write, chunk)
+            await run_blocking(image_file.close)
+        except BaseException:
+            if image_file is not None:
+                image_file.close()
+                os.remove(filepath)
+            raise
+        if image_cache is not None:
+            try:
+                # copying across file systems may take a while, the index is updated in the loop
+                await run_blocking(image_cache.store, filepath, content_hash.hexdigest())
+                image_cache.add(data["href"], filepath, content_hash.hexdigest())
+                image_cache.track(filepath, content_hash.hexdigest(), data["href"])
+            except Exception as exc:
+                logger.error("Caching image {} failed.".format(data["href"]))
+                logger.exception(exc)
+        return filepath
+
+    async def remove_images(self, images):
+        if image_cache is not None:
+            for image in images:
+                image_cache.forget(image)
+        await super().remove_images(images)
 
     async def _convert_image(self, item):
         logger.debug("CONVERTING IMAGE")
@@ -108,33 +284,25 @@ class LiveblogScribbleliveConverter(BaseConverter):
             logger.exception(e)
         return content, tmp_path
 
-    async def _convert_text(self, item):
+    def _render_text(self, item):
         logger.debug("CONVERTING TEXT")
-        content = "<p>"
-        text = item["item"]["text"].strip()
-        text = text.replace("<ol>", "").replace("</ol>", "<br>")
-        text = text.replace("<ul>", "").replace("</ul>", "<br>")
-        text = text.replace("<li>", "<br> &bull; ").replace("</li>", "")
-        text = text.replace("strike>", "s>")
-        if text.startswith('<p>') and text.endswith("</p>"):
-            text = text[3:-4]
-        content += bleach.clean(text, tags=["b", "i", "a", "s", "br", "p", "div"], strip=True)
-        content += "</p>"
-        content = content.replace("<p><br></p>", "")
-        content = content.replace("<p></p>", "")
-        return content
+        return clean_text(item["item"]["text"])
 
-    async def _convert_quote(self, item):
+    def _render_quote(self, item):
         logger.debug("CONVERTING QUOTE")
         meta = item["item"]["meta"]
-        content = "<blockquote>{}<br>".format(meta.get("quote",""))
         if meta.get("credit"):
-            content += "<br> &bull; <i>{}</i>".format(meta.get("credit", ""))
-        content += "</blockquote>"
-        return content
+            return "<blockquote>{}<br><br> &bull; <i>{}</i></blockquote>".format(meta.get("quote", ""), meta["credit"])
+        return "<blockquote>{}<br></blockquote>".format(meta.get("quote", ""))
+
+    async def _convert_text(self, item):
+        return self._render_text(item)
+
+    async def _convert_quote(self, item):
+        return self._render_quote(item)
 
     def _prepare_facebook_embed(self, embed):
-        embed = re.sub(r'<script>.*<\/script>$', '', embed)
+        embed = _facebook_script_re.sub('', embed)
         return embed
 
     def _prepare_youtube_embed(self, meta):
@@ -146,43 +314,42 @@ class LiveblogScribbleliveConverter(BaseConverter):
         return embed
 
     def _prepare_twitter_embed(self, embed):
-        embed = re.sub(r'<script[^<]*<\/script>$', '', embed, flags=re.M)
+        embed = _script_re.sub('', embed)
         logger.debug("Converted Tweet to "+embed)
         return embed.strip()
 
     def _prepare_instagram_embed(self, embed):
-        embed = re.sub(r'<script[^<]*<\/script>$', '', embed, flags=re.M)
+        embed = _script_re.sub('', embed)
         return embed.strip()
 
+    async def _convert_twitter_embed(self, meta):
+        return self._prepare_twitter_embed(await self._get_twitter_embed(meta["original_url"]))
+
+    async def _convert_instagram_embed(self, meta):
+        return self._prepare_instagram_embed(await self._get_instagram_embed(meta["original_url"]))
+
+    def _convert_instagram_html(self, meta):
+        return self._prepare_instagram_embed(meta["html"])
+
+    def _convert_facebook_embed(self, meta):
+        return self._prepare_facebook_embed(meta["html"])
+
+    def _convert_iframe_embed(self, meta):
+        return meta["html"]
+
     async def _convert_embed(self, item):
+        """Converts embed **item** with the matching provider of :data:`embed_providers`, embeds
+        without provider are left out (positive list)."""
         logger.debug("Converting embed: {item}".format(item=repr(item)))
 
         meta = item["item"]["meta"]
-        provider = meta.get("provider_name", "")
-        if provider == "Twitter":
-            twitter_embed = await self._get_twitter_embed(meta["original_url"])
-            content = self._prepare_twitter_embed(twitter_embed)
-        if provider == "YouTube":
-            content = self._prepare_youtube_embed(meta)
-        elif meta.get("provider_name") == "Facebook":
-            content = self._prepare_facebook_embed(meta["html"])
-        elif meta.get("provider_name") == "Instagram":
-            insta_embed = await self._get_instagram_embed(meta["original_url"])
-            content = self._prepare_instagram_embed(insta_embed)
-        elif meta.get("html", "").find('class="instagram-media"') > -1:
-            content = self._prepare_instagram_embed(meta["html"])
-        elif meta.get("html", "").find("youtube.com") > -1 and meta.get("html", "").find("embedly-embed") > -1:
-            content = self._prepare_youtube_embed(meta)
-        elif meta.get("html", "").find('youtube.com/embed') > -1:
-            content = self._prepare_youtube_embed(meta)
-        elif meta.get("html", "").find('<iframe ') > -1:
-            content = meta["html"]
-        else:
-            pass # positive list
+        content = ""
+        provider = embed_providers.match(meta)
+        if provider is not None:
+            content = await embed_providers.convert(provider, self, meta)
 
         # add extra text
-
-        if provider != "YouTube":
+        if provider is None or provider.with_text:
             if meta.get("title"):
                 content += "<br><div><strong>{}</strong></div>".format(meta["title"])
             if meta.get("description"):
@@ -191,38 +358,198 @@ class LiveblogScribbleliveConverter(BaseConverter):
                 content += "<div><i>{}</i></div>".format(meta["credit"])
         return content
 
-    async def convert(self, post):
-        """ See https://developer.scribblelive.com/accepted-and-stripped-html-tags-posted-via-api/
-            for more infos by SL about supported HTML."""
-        content =  ""
+    def _get_item_key(self, item):
+        data = json.dumps([item["item"]["item_type"], item["item"].get("text"), item["item"].get("meta")],
+                          sort_keys=True, default=str)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def _render_item(self, item):
+        """Returns converted HTML of an item, which needs no network access."""
+        logger.debug("Converting "+item["item"]["item_type"])
+        if item["item"]["item_type"] == "text":
+            return self._render_text(item)
+        elif item["item"]["item_type"] == "quote":
+            return self._render_quote(item)
+        elif item["item"]["item_type"] == "image":
+            return self._render_image_inline(item) or ""
+        else:
+            logger.debug("CONVERSION UNKNOWN")
+            logger.debug("Typ: {}".format(item["type"]))
+            logger.debug("Item-Type: {}".format(item["item"]["item_type"]))
+            logger.debug(item)
+            logger.debug("\n\n")
+        return ""
+
+    def _convert_item_sync(self, item):
+        """Returns converted HTML of text, quote, linked image or unknown **item**, unchanged
+        items are served from the item cache."""
+        if item["item"]["item_type"] not in CACHED_ITEM_TYPES:
+            return self._render_item(item)
+        key = self._get_item_key(item)
+        content = item_cache.get(key)
+        if content is None:
+            content = self._render_item(item)
+            item_cache.set(key, content)
+        return content
+
+    async def _run_in_pool(self, items):
+        pool = get_process_pool(self.convert_processes)
+        try:
+            return await asyncio.get_event_loop().run_in_executor(pool, render_items, type(self), items)
+        except BrokenProcessPool:
+            discard_process_pool(pool)
+            raise
+
+    async def _render_in_pool(self, items):
+        """Returns converted HTML or the exception for each of **items**, rendered in the process
+        pool. Unchanged items are served from the item cache."""
+        results = [None] * len(items)
+        keys = {}
+        for pos, item in enumerate(items):
+            try:
+                if item["item"]["item_type"] in CACHED_ITEM_TYPES:
+                    keys[pos] = self._get_item_key(item)
+                    results[pos] = item_cache.get(keys[pos])
+            except Exception as exc:
+                results[pos] = exc
+        missing = [pos for pos, res in enumerate(results) if res is None]
+        if not missing:
+            return results
+        to_render = [items[pos] for pos in missing]
+        try:
+            try:
+                rendered = await self._run_in_pool(to_render)
+            except BrokenProcessPool as exc:
+                # a worker died, e.g. killed for its memory, the items are rendered in a new pool
+                logger.warning("Process pool is broken, starting a new one: {!r}".format(exc))
+                rendered = await self._run_in_pool(to_render)
+        except Exception as exc:
+            logger.error("Rendering in process pool failed, rendering in process.")
+            logger.exception(exc)
+            rendered = render_items(type(self), to_render)
+        for pos, res in zip(missing, rendered):
+            results[pos] = res
+            if pos in keys and not isinstance(res, Exception):
+                item_cache.set(keys[pos], res)
+        return results
+
+    async def _convert_item(self, item, semaphore, upload=False):
+        """Returns converted HTML of **item** and the list of images to upload with it.
+        Unchanged items are served from the item cache, embeds only if their provider is
+        cacheable.
+
+        :param upload: download image **item** for uploading it, instead of linking it"""
+        if upload:
+            content, img_path = await self._convert_image(item)
+            if img_path:
+                return content, [img_path]
+            # link image, if the download failed
+        if not self._is_cacheable(item):
+            return await self._convert_item_uncached(item, semaphore), []
+        key = self._get_item_key(item)
+        content = item_cache.get(key)
+        if content is None:
+            content = await self._convert_item_uncached(item, semaphore)
+            item_cache.set(key, content)
+        return content, []
+
+    def _is_cacheable(self, item):
+        if item["item"]["item_type"] not in CACHED_ITEM_TYPES:
+            return False
+        if item["item"]["item_type"] == "embed":
+            # Twitter and Instagram embeds have their own oEmbed cache
+            provider = embed_providers.match(item["item"].get("meta") or {})
+            return provider is None or provider.is_cacheable(self)
+        return True
+
+    async def _convert_item_uncached(self, item, semaphore):
+        if item["item"]["item_type"] == "embed":
+            # embeds may call external APIs, limit parallel requests
+            async with semaphore:
+                return await self._convert_embed(item)
+        elif self._is_large(item):
+            # sanitizing large texts would block the event loop
+            return await run_blocking(self._render_item, item)
+        return self._render_item(item)
+
+    def _is_large(self, item):
+        """Returns **True** for text items longer than **offload_size** characters."""
+        return item["item"]["item_type"] == "text" and len(item["item"].get("text") or "") > self.offload_size
+
+    async def _convert_post(self, post, semaphore):
+        content = []
         images = []
         try:
             for g in post.get("groups", []):
                 if g["id"] != "main":
                     continue
 
-                for item in g["refs"]:
-                    logger.debug("Converting "+item["item"]["item_type"])
-                    if item["item"]["item_type"] == "text":
-                        content += await self._convert_text(item)
-                    elif item["item"]["item_type"] == "quote":
-                        content += await self._convert_quote(item)
-                    elif item["item"]["item_type"] == "image":
-                        caption, img_path = await self._convert_image_inline(item)
-                        if caption:
-                            content += caption
-                        #if img_path:
-                        #    content += caption
-                        #    images.append(img_path)
-                    elif item["item"]["item_type"] == "embed":
-                        content += await self._convert_embed(item)
+                refs = g["refs"]
+                item_types = [(item.get("item") or {}).get("item_type") for item in refs]
+                upload_pos = None
+                if self.image_upload and "image" in item_types:
+                    upload_pos = item_types.index("image")
+                # items without network access are converted right away, others concurrently
+                results = [None] * len(refs)
+                pending = []
+                local = []
+                for pos, item_type in enumerate(item_types):
+                    if pos == upload_pos or item_type == "embed":
+                        pending.append(pos)
+                    elif not self.convert_processes and self._is_large(refs[pos]):
+                        pending.append(pos)
                     else:
-                        logger.debug("CONVERSION UNKNOWN")
-                        logger.debug("Typ: {}".format(item["type"]))
-                        logger.debug("Item-Type: {}".format(item["item"]["item_type"]))
-                        logger.debug(item)
-                        logger.debug("\n\n")
+                        local.append(pos)
+                if self.convert_processes and local:
+                    rendered = await self._render_in_pool([refs[pos] for pos in local])
+                    for pos, res in zip(local, rendered):
+                        results[pos] = res if isinstance(res, Exception) else (res, [])
+                else:
+                    for pos in local:
+                        try:
+                            results[pos] = (self._convert_item_sync(refs[pos]), [])
+                        except Exception as exc:
+                            results[pos] = exc
+                if pending:
+                    converted = await asyncio.gather(
+                        *[self._convert_item(refs[pos], semaphore, upload=pos == upload_pos) for pos in pending],
+                        return_exceptions=True)
+                    for pos, res in zip(pending, converted):
+                        results[pos] = res
+                error = None
+                for res in results:
+                    if error is None and isinstance(res, Exception):
+                        error = res
+                    elif error is None:
+                        content.append(res[0])
+                        images.extend(res[1])
+                    elif not isinstance(res, Exception):
+                        # downloads of items after the failed one are not used
+                        await self.remove_images(res[1])
+                if error is not None:
+                    raise error
         except Exception as e:
             logger.error("Converting post failed.")
             logger.exception(e)
-        return ConversionResult(content=content, images=images)
+        return ConversionResult(content="".join(content), images=images)
+
+    async def convert_many(self, posts):
+        """Converts a batch of **posts**, returns a list with a :class:`ConversionResult` per post.
+
+        Text, quotes and linked images are converted synchronously, or in a process pool with
+        **convert_processes** workers if set. Otherwise texts longer than **offload_size**
+        characters are converted in the thread pool. Embeds and image downloads of all posts run
+        concurrently, at most **embed_concurrency** embeds at a time."""
+        semaphore = asyncio.Semaphore(self.embed_concurrency)
+        return await asyncio.gather(*[self._convert_post(post, semaphore) for post in posts])
+
+    async def convert(self, post):
+        """ See https://developer.scribblelive.com/accepted-and-stripped-html-tags-posted-via-api/
+            for more infos by SL about supported HTML.
+
+            Items of a post are converted concurrently, the content keeps the order of the items.
+            If an item fails, the content of the preceding items is returned.
+
+            With **image_upload** enabled, the first image of the post is downloaded and uploaded
+            with the post, Scribblelive takes only one image per post. Further images are linked."""
+        return (await self.convert_many([post]))[0]
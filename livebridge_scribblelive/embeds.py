@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EmbedProvider(object):
+    """Converts the embeds of one provider.
+
+    :param name: name used for the timings
+    :param handler: function called with converter and embed meta data, returning the HTML or
+                    an awaitable of it. Alternatively name of a converter method, called with
+                    the meta data.
+    :param provider_name: matches embeds with this **provider_name**
+    :param html: regular expressions, which all must match the embed HTML
+    :param with_text: whether title, description and credit are added to the HTML
+    :param fallback: generic provider, checked after all other providers
+    :param cacheable: whether the converted HTML may be kept in the item cache. By default only
+                      for handlers which aren't coroutine functions, as those may call external APIs."""
+
+    def __init__(self, name, handler, *, provider_name=None, html=(), with_text=True, fallback=False,
+                 cacheable=None):
+        self.name = name
+        self.handler = handler
+        self.provider_name = provider_name
+        self.patterns = [re.compile(pattern) for pattern in html]
+        self.with_text = with_text
+        self.fallback = fallback
+        self.cacheable = cacheable
+
+    def matches(self, html):
+        return all(pattern.search(html) for pattern in self.patterns)
+
+    def is_cacheable(self, converter):
+        """Returns **True** if the HTML converted by **converter** may be cached."""
+        if self.cacheable is not None:
+            return self.cacheable
+        handler = getattr(converter, self.handler) if isinstance(self.handler, str) else self.handler
+        return not asyncio.iscoroutinefunction(handler)
+
+    async def convert(self, converter, meta):
+        if isinstance(self.handler, str):
+            content = getattr(converter, self.handler)(meta)
+        else:
+            content = self.handler(converter, meta)
+        if asyncio.iscoroutine(content):
+            content = await content
+        return content
+
+
+class EmbedRegistry(object):
+    """Embed providers, embeds are matched by their **provider_name** first, then by their
+    HTML in the order the providers were registered. Conversion timings are recorded per
+    provider."""
+
+    def __init__(self):
+        self._by_name = {}
+        self._by_html = []
+        self._timings = {}
+
+    def register(self, name, handler, **kwargs):
+        """Registers a provider, see :class:`EmbedProvider` for the arguments. Providers matching
+        the HTML are checked before the **fallback** providers."""
+        provider = EmbedProvider(name, handler, **kwargs)
+        if provider.provider_name:
+            self._by_name[provider.provider_name] = provider
+        elif provider.patterns:
+            if provider.fallback:
+                self._by_html.append(provider)
+            else:
+                pos = next((pos for pos, other in enumerate(self._by_html) if other.fallback), len(self._by_html))
+                self._by_html.insert(pos, provider)
+        else:
+            raise ValueError("Embed provider {} needs provider_name or html patterns.".format(name))
+        return provider
+
+    def match(self, meta):
+        """Returns the provider of embed **meta**, **None** if not supported."""
+        provider = self._by_name.get(meta.get("provider_name", ""))
+        if provider is not None:
+            return provider
+        html = meta.get("html") or ""
+        for provider in self._by_html:
+            if provider.matches(html):
+                return provider
+        return None
+
+    async def convert(self, provider, converter, meta):
+        """Returns the HTML of embed **meta** converted by **provider**, recording the time."""
+        started = time.perf_counter()
+        failed = True
+        try:
+            content = await provider.convert(converter, meta)
+            failed = False
+            return content
+        finally:
+            timing = self._timings.setdefault(provider.name, {"count": 0, "errors": 0, "seconds": 0.0})
+            timing["count"] += 1
+            timing["errors"] += failed
+            timing["seconds"] += time.perf_counter() - started
+
+    def stats(self):
+        """Returns number of conversions, failures and total seconds per provider."""
+        return {name: dict(timing) for name, timing in self._timings.items()}
+
+    def clear_stats(self):
+        self._timings.clear()
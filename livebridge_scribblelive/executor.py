@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from livebridge_scribblelive import config
+
+_executor = None
+
+
+def get_executor():
+    """Returns the bounded thread pool for blocking work like file access, shared process-wide.
+    Its size is set with **LB_SCRIBBLE_THREADS**."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=config.THREADS)
+    return _executor
+
+
+async def run_blocking(func, *args):
+    """Runs **func** with **args** in the thread pool and returns its result."""
+    return await asyncio.get_event_loop().run_in_executor(get_executor(), func, *args)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import os
+import os.path
+import shutil
+import sqlite3
+from livebridge_scribblelive.cache import normalize_url
+
+logger = logging.getLogger(__name__)
+
+
+def link_file(src, dst):
+    """Hard links **src** to **dst**, copies it if linking is not possible."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ImageCache(object):
+    """Downloaded images in directory **path**, shared by all events and kept across restarts.
+    Files are stored under the sha256 of their content, so an image used with several rendition
+    URLs is kept once. The least recently used files are removed, when all files together exceed
+    **max_size** bytes. Every upload of a file is counted, to trace images uploaded repeatedly,
+    the temporary files handed to the target are tracked for it."""
+
+    def __init__(self, path, max_size=500 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "index.db"))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS files (digest TEXT PRIMARY KEY, size INTEGER, "
+                           "accessed INTEGER, uploads INTEGER DEFAULT 0)")
+        self._conn.commit()
+        # access counter for LRU eviction, accesses are written with the next change
+        self._tick = self._conn.execute("SELECT MAX(accessed) FROM files").fetchone()[0] or 0
+        self._accessed = {}
+        # digest and URL of temporary image files, by path
+        self._downloads = {}
+
+    def get_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+
+    def get(self, url):
+        """Returns the digest of the cached image of **url**, **None** if not cached."""
+        row = self._conn.execute("SELECT digest FROM urls WHERE url=?", (normalize_url(url),)).fetchone()
+        if row is not None:
+            if os.path.exists(self.get_path(row[0])):
+                self._tick += 1
+                self._accessed[row[0]] = self._tick
+                self.hits += 1
+                return row[0]
+            self._remove(row[0])
+            self._conn.commit()
+        self.misses += 1
+        return None
+
+    def store(self, filepath, digest):
+        """Links or copies the downloaded image **filepath** into the cache directory. Only file
+        access, it may be called in a thread before :meth:`add`."""
+        target = self.get_path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            link_file(filepath, target)
+
+    def add(self, url, filepath, digest):
+        """Adds the downloaded image **filepath** of **url** with content hash **digest**."""
+        self.store(filepath, digest)
+        target = self.get_path(digest)
+        self._tick += 1
+        self._accessed.pop(digest, None)
+        self._write_accessed()
+        self._conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (normalize_url(url), digest))
+        self._conn.execute("INSERT OR IGNORE INTO files (digest, size, accessed) VALUES (?, ?, ?)",
+                           (digest, os.path.getsize(target), self._tick))
+        self._conn.execute("UPDATE files SET accessed=? WHERE digest=?", (self._tick, digest))
+        self._evict()
+        self._conn.commit()
+
+    def track(self, filepath, digest, url):
+        """Remembers the temporary file **filepath** as copy of image **digest** of **url**."""
+        self._downloads[filepath] = (digest, url)
+
+    def get_download(self, filepath):
+        """Returns digest and URL of the temporary file **filepath**, **None** if not tracked."""
+        return self._downloads.get(filepath)
+
+    def forget(self, filepath):
+        self._downloads.pop(filepath, None)
+
+    def record_upload(self, digest, url):
+        """Counts an upload of image **digest**, returns the number of uploads so far."""
+        self._conn.execute("UPDATE files SET uploads=uploads+1 WHERE digest=?", (digest,))
+        self._conn.commit()
+        row = self._conn.execute("SELECT uploads FROM files WHERE digest=?", (digest,)).fetchone()
+        uploads = row[0] if row else 1
+        if uploads > 1:
+            logger.info("Image {} of {} uploaded again, {} uploads.".format(digest, url, uploads))
+        return uploads
+
+    def _write_accessed(self):
+        if self._accessed:
+            self._conn.executemany("UPDATE files SET accessed=? WHERE digest=?",
+                                   [(tick, digest) for digest, tick in self._accessed.items()])
+            self._accessed.clear()
+
+    def _remove(self, digest):
+        self._accessed.pop(digest, None)
+        self._conn.execute("DELETE FROM urls WHERE digest=?", (digest,))
+        self._conn.execute("DELETE FROM files WHERE digest=?", (digest,))
+        try:
+            os.remove(self.get_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        rows = self._conn.execute("SELECT digest, size FROM files ORDER BY accessed").fetchall()
+        for digest, file_size in rows:
+            if size <= self.max_size:
+                break
+            self._remove(digest)
+            size -= file_size
+            self.evicted += 1
+
+    def clear(self):
+        for digest, in self._conn.execute("SELECT digest FROM files").fetchall():
+            self._remove(digest)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def stats(self):
+        files, size, uploads, duplicates = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(uploads), 0), "
+            "COALESCE(SUM(MAX(uploads - 1, 0)), 0) FROM files").fetchone()
+        return {"files": files, "size": size, "hits": self.hits, "misses": self.misses,
+                "evicted": self.evicted, "uploads": uploads, "duplicate_uploads": duplicates}
+
+
+def get_image_cache(path=None, **kwargs):
+    """Returns an :class:`ImageCache` if **path** is given, **None** if not set or the cache
+    can't be opened."""
+    if path:
+        try:
+            return ImageCache(path, **kwargs)
+        except Exception as exc:
+            logger.error("Opening image cache {} failed, images are not cached.".format(path))
+            logger.exception(exc)
+    return None
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _Operation(object):
+
+    def __init__(self, action, func, dropped):
+        self.action = action
+        self.func = func
+        self.dropped = dropped
+        self.future = asyncio.get_event_loop().create_future()
+        self.superseded = []
+
+
+class WriteQueue(object):
+    """Sends the write operations of a post in the order they were queued. An update which is
+    still waiting is dropped, when a newer update or a delete of the same post is queued.
+    Callers of a dropped update get the result of the newer update, or the **dropped** value
+    of the update if it was dropped by a delete."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._pending = {}
+        self._workers = {}
+
+    def __len__(self):
+        return sum(len(ops) for ops in self._pending.values())
+
+    async def put(self, key, action, func, *, dropped=None):
+        """Queues operation **action** (**create**, **update** or **delete**) of the post **key**
+        and returns its result.
+
+        :param func: function returning the awaitable sending the operation
+        :param dropped: result for an update dropped in favour of a delete"""
+        pending = self._pending.setdefault(key, deque())
+        op = _Operation(action, func, dropped)
+        if action in ("update", "delete"):
+            for old in [old for old in pending if old.action == "update"]:
+                pending.remove(old)
+                self.coalesced += 1
+                if action == "update":
+                    op.superseded.extend([old] + old.superseded)
+                else:
+                    for dropped_op in [old] + old.superseded:
+                        dropped_op.future.set_result(dropped_op.dropped)
+                logger.debug("Dropped superseded update of post {}".format(key))
+        pending.append(op)
+        if key not in self._workers:
+            self._workers[key] = asyncio.ensure_future(self._work(key))
+        return await asyncio.shield(op.future)
+
+    async def _work(self, key):
+        pending = self._pending[key]
+        try:
+            while pending:
+                op = pending.popleft()
+                futures = [op.future] + [old.future for old in op.superseded]
+                try:
+                    result = await op.func()
+                except Exception as exc:
+                    for future in futures:
+                        future.set_exception(exc)
+                else:
+                    for future in futures:
+                        future.set_result(result)
+        finally:
+            for op in pending:
+                for old in [op] + op.superseded:
+                    old.future.cancel()
+            del self._workers[key]
+            del self._pending[key]
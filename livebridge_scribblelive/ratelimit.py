@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_AFTER = 5
+
+
+def parse_retry_after(value, default=DEFAULT_RETRY_AFTER):
+    """Returns seconds to wait from the value of a **Retry-After** header, which is either
+    given in seconds or as HTTP date."""
+    if not value:
+        return default
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except Exception:
+        return default
+
+
+class RateLimiter(object):
+    """Token bucket allowing **rate** requests per second with bursts up to **burst** requests.
+    Without **rate**, requests are only held back while the bucket is paused."""
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate or 1, 1)
+        self.throttled = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Waits until a request may be sent."""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if not self.rate:
+                return
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Holds back all requests for **seconds**, e.g. after the API answered with status 429."""
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning("Scribblelive API throttled, pausing requests for {:.1f}s".format(seconds))
+
+    @property
+    def paused(self):
+        return time.monotonic() < self._paused_until
+
+
+_limiters = {}
+
+
+def get_rate_limiter(api_key, rate=None, burst=None):
+    """Returns the rate limiter shared by all clients using **api_key**. The settings of the
+    first client are used."""
+    if api_key not in _limiters:
+        _limiters[api_key] = RateLimiter(rate, burst)
+    return _limiters[api_key]
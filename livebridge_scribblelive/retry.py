@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import aiohttp
+import asyncio
+import random
+import time
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class RetryPolicy(object):
+    """Decides whether a failed request is repeated and how long to wait before, using
+    exponential backoff with full jitter.
+
+    :param retries: max. number of repetitions
+    :param base_delay: upper bound in seconds of the first delay, doubled with every attempt
+    :param max_delay: upper bound in seconds of a single delay
+    :param deadline: seconds after the first attempt, after which no more retries are done"""
+
+    def __init__(self, retries=3, base_delay=0.5, max_delay=10, deadline=30):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def is_retryable(self, exc, idempotent=True):
+        """Returns **True** if the request failing with **exc** may be repeated. Requests which
+        are not idempotent are only repeated if they couldn't be sent at all."""
+        if isinstance(exc, aiohttp.ClientConnectorError):
+            return True
+        if not idempotent:
+            return False
+        if isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return True
+        return getattr(exc, "status", None) in RETRY_STATUSES
+
+    def get_delay(self, attempt, started):
+        """Returns seconds to wait before repeating the request the **attempt** time (starting with
+        0), **None** if no retry is left or the deadline would be exceeded."""
+        if attempt >= self.retries:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() + delay - started > self.deadline:
+            return None
+        return delay
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import re
+import threading
+from bleach.sanitizer import Cleaner
+
+TEXT_TAGS = ["b", "i", "a", "s", "br", "p", "div"]
+
+# lists are turned into bullet lines, strike into s
+_REWRITES = {
+    "<ol>": "",
+    "</ol>": "<br>",
+    "<ul>": "",
+    "</ul>": "<br>",
+    "<li>": "<br> &bull; ",
+    "</li>": "",
+    "strike>": "s>",
+}
+_rewrite_re = re.compile("|".join(re.escape(tag) for tag in _REWRITES))
+
+# building a cleaner sets up the html5lib parser and serializer, it is reused for all texts.
+# The parser keeps state while cleaning, so every thread gets its own cleaner.
+_local = threading.local()
+
+
+def _rewrite(match):
+    return _REWRITES[match.group(0)]
+
+
+def get_cleaner():
+    cleaner = getattr(_local, "cleaner", None)
+    if cleaner is None:
+        cleaner = _local.cleaner = Cleaner(tags=TEXT_TAGS, strip=True)
+    return cleaner
+
+
+def clean_text(text):
+    """Returns the HTML **text** of a text item as paragraph for Scribblelive. List tags are
+    rewritten in a single pass, tags other than :data:`TEXT_TAGS` are stripped and empty
+    paragraphs are removed. As the rewritten text isn't searched again, fragments joined by
+    removing a list tag, like ``<stri</li>ke>``, don't become a rewritten tag but are stripped."""
+    text = _rewrite_re.sub(_rewrite, text.strip())
+    if text.startswith("<p>") and text.endswith("</p>"):
+        text = text[3:-4]
+    content = "<p>" + get_cleaner().clean(text) + "</p>"
+    return content.replace("<p><br></p>", "").replace("<p></p>", "")
@@ -13,18 +13,89 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import os.path
+import time
+from collections import deque
 from livebridge.base import BaseTarget, TargetResponse
+from livebridge_scribblelive import converters
 from livebridge_scribblelive.common import ScribbleLiveClient, ScribbleLiveException
+from livebridge_scribblelive.executor import run_blocking
+from livebridge_scribblelive.outbound import WriteQueue
 
 
 logger = logging.getLogger(__name__)
 
 
+class PreparedConverter(object):
+    """Wraps **converter** to return the **conversion** of a post done ahead, so it is not
+    converted and its images are not downloaded twice."""
+
+    def __init__(self, converter, conversion):
+        self.converter = converter
+        self.conversion = conversion
+
+    async def convert(self, data):
+        return self.conversion
+
+    async def remove_images(self, images):
+        return await self.converter.remove_images(images)
+
+
 class ScribbleLiveTarget(ScribbleLiveClient, BaseTarget):
 
     type = "scribble"
 
+    def __init__(self, *, config={}, **kwargs):
+        super().__init__(config=config, **kwargs)
+        self.force_updates = bool(config.get("force_updates", False))
+        self.skipped_updates = 0
+        # fingerprints of the content last sent, by id at target
+        self._fingerprints = {}
+        self._write_queue = WriteQueue() if config.get("write_queue") else None
+        # conversions done ahead by the backfill, by post id
+        self._prepared = {}
+
+    def _get_fingerprint(self, post):
+        fingerprint = hashlib.sha1(str(post.content).encode("utf-8"))
+        for image in post.images or []:
+            if os.path.isfile(image):
+                with open(image, "rb") as image_file:
+                    for chunk in iter(lambda: image_file.read(65536), b""):
+                        fingerprint.update(chunk)
+            else:
+                fingerprint.update(str(image).encode("utf-8"))
+        return fingerprint.hexdigest()
+
+    async def _fingerprint(self, post):
+        """Returns the fingerprint of **post**, image files are read in the thread pool."""
+        if post.images:
+            return await run_blocking(self._get_fingerprint, post)
+        return self._get_fingerprint(post)
+
+    def _get_converter(self, post):
+        converter = super()._get_converter(post)
+        conversion = self._prepared.pop(post.id, None)
+        if converter and conversion is not None:
+            return PreparedConverter(converter, conversion)
+        return converter
+
+    async def handle_post(self, post):
+        """Handles **post** like :class:`livebridge.base.BaseTarget`, but removes downloaded images
+        also when the post is deleted, ignored, empty or publishing failed."""
+        try:
+            return await super().handle_post(post)
+        finally:
+            images = [image for image in post.images or []
+                      if isinstance(image, str) and os.path.isfile(image)]
+            converter = self._get_converter(post) if images else None
+            if converter:
+                await converter.remove_images(images)
+
     def get_id_at_target(self, post):
         """Extracts from the given **post** the id of the target resource.
         
@@ -39,27 +110,63 @@ class ScribbleLiveTarget(ScribbleLiveClient, BaseTarget):
         return id_at_target
 
     async def post_item(self, post):
+        if self._write_queue is not None:
+            return await self._write_queue.put(post.id, "create", lambda: self._post_item(post))
+        return await self._post_item(post)
+
+    async def update_item(self, post):
+        if self._write_queue is not None:
+            return await self._write_queue.put(post.id, "update", lambda: self._update_item(post),
+                                               dropped=TargetResponse(post.target_doc or {}))
+        return await self._update_item(post)
+
+    async def delete_item(self, post):
+        if self._write_queue is not None:
+            return await self._write_queue.put(post.id, "delete", lambda: self._delete_item(post))
+        return await self._delete_item(post)
+
+    async def _post_item(self, post):
         await self._check_login()
         post_url = "{}/event/{}?".format(self.endpoint, self.event_id)
-        return TargetResponse(await self._post(post_url, post.images, post.content))
+        resp = TargetResponse(await self._post(post_url, post.images, post.content))
+        if resp.get("Id"):
+            self._fingerprints[str(resp["Id"])] = await self._fingerprint(post)
+            self._record_upload(post)
+        return resp
 
-    async def update_item(self, post):
+    def _record_upload(self, post):
+        # counts the upload of a cached image, only the first image of a post is uploaded
+        if converters.image_cache is not None and post.images and isinstance(post.images[0], str):
+            download = converters.image_cache.get_download(post.images[0])
+            if download is not None:
+                converters.image_cache.record_upload(*download)
+
+    async def _update_item(self, post):
         id_at_target = self.get_id_at_target(post)
         if not id_at_target:
             logger.warning("Handling updated item without TARGET-ID: [{}] on {}".format(post.id, self.target_id))
             return False
+        fingerprint = await self._fingerprint(post)
+        if not self.force_updates and self._fingerprints.get(str(id_at_target)) == fingerprint:
+            self.skipped_updates += 1
+            logger.debug("Skipped unchanged update: [{}] on {}".format(post.id, self.target_id))
+            return TargetResponse(post.target_doc)
         await self._check_login()
         update_url = "{}/post/{}?".format(self.endpoint_v1, self.get_id_at_target(post))
-        return TargetResponse(await self._put(update_url, post.content, post.images))
+        resp = TargetResponse(await self._put(update_url, post.content, post.images))
+        self._fingerprints[str(id_at_target)] = fingerprint
+        return resp
 
-    async def delete_item(self, post):
+    async def _delete_item(self, post):
         id_at_target = self.get_id_at_target(post)
         if not id_at_target:
             logger.warning("Handling deleted item without TARGET-ID: [{}] on {}".format(post.id, self.target_id))
             return False
         await self._check_login()
         delete_url = "{}/post/{}/delete?".format(self.endpoint, id_at_target)
-        return TargetResponse(await self._get(delete_url))
+        resp = TargetResponse(await self._get(delete_url))
+        self._fingerprints.pop(str(id_at_target), None)
+        return resp
 
     async def handle_extras(self, post):
         if self.get_id_at_target(post) and not post.is_deleted:
@@ -90,3 +197,92 @@ class ScribbleLiveTarget(ScribbleLiveClient, BaseTarget):
         await self._check_login()
         unstick_url = "{}/post/{}/unstick?".format(self.endpoint, post_id)
         return await self._get(unstick_url)
+
+    async def _prepare_backfill_post(self, post):
+        # converts the post ahead, the conversion is used by handle_post
+        converter = self._get_converter(post)
+        if converter:
+            return await converter.convert(post.data)
+        return None
+
+    async def _publish_backfill_post(self, post, conversion):
+        if conversion is not None:
+            self._prepared[post.id] = conversion
+        try:
+            await self.handle_post(post)
+        finally:
+            self._prepared.pop(post.id, None)
+
+    def _read_checkpoint(self, path):
+        if path and os.path.isfile(path):
+            with open(path) as checkpoint_file:
+                data = json.load(checkpoint_file)
+                return data.get("count", 0), data.get("failed_ids", [])
+        return 0, []
+
+    def _write_checkpoint(self, path, count, post, failed_ids):
+        if path:
+            tmp_path = "{}.tmp".format(path)
+            with open(tmp_path, "w") as checkpoint_file:
+                json.dump({"count": count, "post_id": post.id, "target_id": self.target_id,
+                           "failed_ids": failed_ids}, checkpoint_file)
+            os.replace(tmp_path, path)
+
+    async def backfill(self, posts, *, concurrency=4, checkpoint=None):
+        """Pushes **posts** of a liveblog into the Scribblelive event, for example when a new event is
+        attached to a long running liveblog. Posts are converted **concurrency** at a time ahead of
+        publishing, but published one after another to keep their chronological order at the event.
+
+        :param posts: iterable or async iterator of posts, oldest first
+        :type posts: livebridge.posts.base.BasePost
+        :param concurrency: number of posts converted in parallel
+        :param checkpoint: path of file to save the progress in, posts already published according \
+            to it are skipped, posts failed before are tried again
+        :returns: dictionary with statistics of the backfill"""
+        started = time.time()
+        done, failed_ids = self._read_checkpoint(checkpoint)
+        failed_ids = list(failed_ids)
+        stats = {"posts": 0, "skipped": 0, "published": 0, "failed": 0, "failed_ids": []}
+        pending = deque()
+
+        async def publish_next():
+            count, post, prepared = pending.popleft()
+            try:
+                await self._publish_backfill_post(post, await prepared)
+                stats["published"] += 1
+                if post.id in failed_ids:
+                    failed_ids.remove(post.id)
+            except Exception as exc:
+                stats["failed"] += 1
+                stats["failed_ids"].append(post.id)
+                if post.id not in failed_ids:
+                    failed_ids.append(post.id)
+                logger.error("Backfill of post {} on {} failed.".format(post.id, self.target_id))
+                logger.exception(exc)
+            self._write_checkpoint(checkpoint, max(count, done), post, failed_ids)
+            if count % 100 == 0:
+                logger.info("Backfill of {}: {} posts, {:.1f} posts/s".format(
+                    self.target_id, count, stats["published"] / max(time.time() - started, 0.001)))
+
+        async def add(post):
+            stats["posts"] += 1
+            if stats["posts"] <= done and post.id not in failed_ids:
+                stats["skipped"] += 1
+                return
+            pending.append((stats["posts"], post, asyncio.ensure_future(self._prepare_backfill_post(post))))
+            if len(pending) >= concurrency:
+                await publish_next()
+
+        if hasattr(posts, "__aiter__"):
+            async for post in posts:
+                await add(post)
+        else:
+            for post in posts:
+                await add(post)
+        while pending:
+            await publish_next()
+
+        stats["seconds"] = time.time() - started
+        stats["posts_per_second"] = stats["published"] / max(stats["seconds"], 0.001)
+        logger.info("Backfill of {} done: {}".format(self.target_id, stats))
+        return stats
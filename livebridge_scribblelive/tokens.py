@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+TOKEN_LIFETIME = 3600
+
+# running logins by (endpoint, user), shared by all clients of the process
+pending_logins = {}
+
+
+class MemoryTokenStore(object):
+    """Keeps auth tokens of Scribblelive users in memory, keyed by endpoint and user."""
+
+    def __init__(self, path=None):
+        self._tokens = {}
+
+    def _key(self, endpoint, user):
+        return "{}|{}".format(endpoint, user)
+
+    def get(self, endpoint, user):
+        """Returns tuple of token and login time, **None** if no valid token is known."""
+        entry = self._tokens.get(self._key(endpoint, user))
+        if entry and time.time() - entry[1] < TOKEN_LIFETIME:
+            return entry
+        return None
+
+    def set(self, endpoint, user, token, auth_time):
+        self._tokens[self._key(endpoint, user)] = (token, auth_time)
+
+    def delete(self, endpoint, user):
+        self._tokens.pop(self._key(endpoint, user), None)
+
+
+class FileTokenStore(MemoryTokenStore):
+    """Keeps auth tokens in a JSON file, so they survive restarts."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        try:
+            with open(path) as token_file:
+                self._tokens = {k: tuple(v) for k, v in json.load(token_file).items()}
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            logger.error("Reading token file {} failed.".format(path))
+            logger.exception(exc)
+
+    def _save(self):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+            with os.fdopen(fd, "w") as token_file:
+                json.dump(self._tokens, token_file)
+            os.replace(tmp_path, self.path)
+        except Exception as exc:
+            logger.error("Writing token file {} failed.".format(self.path))
+            logger.exception(exc)
+
+    def set(self, endpoint, user, token, auth_time):
+        super().set(endpoint, user, token, auth_time)
+        self._save()
+
+    def delete(self, endpoint, user):
+        super().delete(endpoint, user)
+        self._save()
+
+
+class SqliteTokenStore(object):
+    """Keeps auth tokens in a sqlite database, so they survive restarts."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tokens (endpoint TEXT, user TEXT, token TEXT, "
+                           "auth_time REAL, PRIMARY KEY (endpoint, user))")
+        self._conn.commit()
+
+    def get(self, endpoint, user):
+        row = self._conn.execute("SELECT token, auth_time FROM tokens WHERE endpoint=? AND user=?",
+                                 (endpoint, user)).fetchone()
+        if row and time.time() - row[1] < TOKEN_LIFETIME:
+            return row
+        return None
+
+    def set(self, endpoint, user, token, auth_time):
+        self._conn.execute("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)",
+                           (endpoint, user, token, auth_time))
+        self._conn.commit()
+
+    def delete(self, endpoint, user):
+        self._conn.execute("DELETE FROM tokens WHERE endpoint=? AND user=?", (endpoint, user))
+        self._conn.commit()
+
+
+TOKEN_STORES = {
+    "memory": MemoryTokenStore,
+    "file": FileTokenStore,
+    "sqlite": SqliteTokenStore,
+}
+
+_stores = {}
+
+
+def get_token_store(kind=None, path=None):
+    """Returns the process-wide token store of type **kind**, which is shared by all targets
+    configured with the same **kind** and **path**.
+
+    :param kind: key of :data:`TOKEN_STORES`, defaults to **memory**
+    :param path: file path for persistent stores
+    :returns: token store"""
+    kind = kind or "memory"
+    key = (kind, path)
+    if key not in _stores:
+        if kind not in TOKEN_STORES:
+            raise ValueError("Unknown token store: {}".format(kind))
+        _stores[key] = TOKEN_STORES[kind](path)
+    return _stores[key]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import os.path
+from aiohttp.payload import BytesPayload, Payload
+from livebridge_scribblelive.executor import run_blocking
+
+CHUNK_SIZE = 2 ** 16
+
+
+class FilePayload(Payload):
+    """Streams a file in chunks, without blocking the event loop. The file is opened when the
+    request body is written and closed afterwards, also if sending fails."""
+
+    def __init__(self, path, size, **kwargs):
+        super().__init__(path, filename=os.path.basename(path), **kwargs)
+        self._size = size
+
+    async def write(self, writer):
+        upload_file = await run_blocking(open, self._value, "rb")
+        try:
+            chunk = await run_blocking(upload_file.read, CHUNK_SIZE)
+            while chunk:
+                await writer.write(chunk)
+                chunk = await run_blocking(upload_file.read, CHUNK_SIZE)
+        finally:
+            upload_file.close()
+
+    def decode(self, encoding="utf-8", errors="strict"):
+        """Returns the content as text, like the payloads of aiohttp. Only used to log or debug
+        a request, uploads are sent with :meth:`write`."""
+        with open(self._value, "rb") as upload_file:
+            return upload_file.read().decode(encoding, errors)
+
+
+class Upload(object):
+    """File to upload, given either as file path or as bytes like object in memory."""
+
+    def __init__(self, image):
+        self.image = image
+        self.size = None
+
+    @property
+    def in_memory(self):
+        return isinstance(self.image, (bytes, bytearray, memoryview)) or hasattr(self.image, "getvalue")
+
+    @property
+    def filename(self):
+        return "image" if self.in_memory else os.path.basename(self.image)
+
+    async def prepare(self):
+        """Determines the size of the upload, returns it."""
+        if isinstance(self.image, (bytes, bytearray, memoryview)):
+            self.size = len(self.image)
+        elif hasattr(self.image, "getvalue"):
+            self.size = len(self.image.getvalue())
+        else:
+            stat = await run_blocking(os.stat, self.image)
+            self.size = stat.st_size
+        return self.size
+
+    def get_payload(self, content_type):
+        """Returns a new payload for every request, so the upload can be repeated."""
+        if isinstance(self.image, (bytes, bytearray, memoryview)):
+            return BytesPayload(bytes(self.image), content_type=content_type, filename=self.filename)
+        elif hasattr(self.image, "getvalue"):
+            return BytesPayload(self.image.getvalue(), content_type=content_type, filename=self.filename)
+        return FilePayload(self.image, self.size, content_type=content_type)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import os.path
+import tempfile
+import time
+from livebridge_scribblelive.cache import TTLCache, SqliteCache, get_cache, normalize_url
+
+
+class TTLCacheTest(asynctest.TestCase):
+
+    def setUp(self):
+        self.cache = TTLCache(maxsize=2, ttl=60, negative_ttl=10)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_normalize_url(self):
+        assert normalize_url(" HTTPS://Twitter.com/dpa_live/status/123/ ") == "https://twitter.com/dpa_live/status/123"
+        assert normalize_url("https://twitter.com/dpa/status/123?s=20#foo") == "https://twitter.com/dpa/status/123?s=20"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_set(self):
+        assert self.cache.get("foo") is None
+        self.cache.set("foo", "bar")
+        assert self.cache.get("foo") == "bar"
+        self.cache.set("baz", "", negative=True)
+        assert self.cache.get("baz") == ""
+        assert self.cache.stats() == {"size": 2, "hits": 2, "misses": 1}
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_lru_eviction(self):
+        self.cache.set("foo", "1")
+        self.cache.set("bar", "2")
+        self.cache.get("foo")
+        self.cache.set("baz", "3")
+        assert len(self.cache) == 2
+        assert self.cache.get("bar") is None
+        assert self.cache.get("foo") == "1"
+        assert self.cache.get("baz") == "3"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_expiry(self):
+        self.cache.set("foo", "bar")
+        self.cache.set("baz", "", negative=True)
+        with asynctest.patch("time.time", return_value=time.time()+30):
+            assert self.cache.get("foo") == "bar"
+            assert self.cache.get("baz") is None
+        with asynctest.patch("time.time", return_value=time.time()+61):
+            assert self.cache.get("foo") is None
+        assert len(self.cache) == 0
+
+        self.cache.clear()
+        assert self.cache.stats() == {"size": 0, "hits": 0, "misses": 0}
+
+
+class SqliteCacheTest(TTLCacheTest):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "oembed.db")
+        self.cache = SqliteCache(self.path, maxsize=2, ttl=60, negative_ttl=10)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_persistence(self):
+        self.cache.set("foo", "bar")
+        self.cache.set("baz", "", negative=True)
+        cache = SqliteCache(self.path)
+        assert cache.get("foo") == "bar"
+        assert cache.get("baz") == ""
+        with asynctest.patch("time.time", return_value=time.time()+30):
+            cache = SqliteCache(self.path)
+        assert len(cache) == 1
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_without_write(self):
+        self.cache.set("foo", "bar")
+        changes = self.cache._conn.total_changes
+        assert self.cache.get("foo") == "bar"
+        assert self.cache._conn.total_changes == changes
+        tick = self.cache._tick
+        self.cache.set("baz", "1")
+        assert self.cache._conn.execute("SELECT accessed FROM cache WHERE key='foo'").fetchone()[0] == tick
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_cache(self):
+        assert type(get_cache(self.path, maxsize=10)) == SqliteCache
+        cache = get_cache(None, maxsize=10, ttl=5)
+        assert type(cache) == TTLCache
+        assert cache.maxsize == 10
+        assert cache.ttl == 5
+        assert type(get_cache("/not/existing/dir/oembed.db")) == TTLCache
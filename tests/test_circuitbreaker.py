@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import time
+from livebridge_scribblelive.circuitbreaker import CircuitBreaker, get_circuit_breaker, get_circuit_states
+
+
+class CircuitBreakerTest(asynctest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(error_rate=0.5, min_requests=4, window=60, reset_timeout=30)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_open(self):
+        for ok in [True, False, True]:
+            self.breaker.record(ok)
+            assert self.breaker.allow() == True
+        self.breaker.record(False)
+        assert self.breaker.state == "open"
+        assert self.breaker.allow() == False
+        assert self.breaker.stats() == {"state": "open", "requests": 0, "failures": 0, "opened": 1}
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_window(self):
+        now = time.monotonic()
+        with asynctest.patch("time.monotonic", return_value=now-61):
+            self.breaker.record(False)
+            self.breaker.record(False)
+        self.breaker.record(False)
+        self.breaker.record(True)
+        assert self.breaker.state == "closed"
+        assert self.breaker.stats()["requests"] == 2
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_half_open(self):
+        for _ in range(4):
+            self.breaker.record(False)
+        assert self.breaker.allow() == False
+        with asynctest.patch("time.monotonic", return_value=time.monotonic()+31):
+            assert self.breaker.allow() == True
+            assert self.breaker.state == "half-open"
+            # only one probe
+            assert self.breaker.allow() == False
+            self.breaker.record(False)
+            assert self.breaker.state == "open"
+        with asynctest.patch("time.monotonic", return_value=time.monotonic()+62):
+            assert self.breaker.allow() == True
+            self.breaker.record(True)
+            assert self.breaker.state == "closed"
+            assert self.breaker.allow() == True
+        assert self.breaker.opened == 2
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_lost_probe(self):
+        for _ in range(4):
+            self.breaker.record(False)
+        with asynctest.patch("time.monotonic", return_value=time.monotonic()+31):
+            assert self.breaker.allow() == True
+        with asynctest.patch("time.monotonic", return_value=time.monotonic()+62):
+            assert self.breaker.allow() == True
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_circuit_breaker(self):
+        breaker = get_circuit_breaker("https://breaker.example.com", {"breaker_min_requests": 3, "foo": 1})
+        assert breaker.min_requests == 3
+        assert breaker.error_rate == 0.5
+        assert get_circuit_breaker("https://breaker.example.com") is breaker
+        assert get_circuit_states()["https://breaker.example.com"]["state"] == "closed"
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+from livebridge_scribblelive.connections import ConnectorRegistry, get_host_key
+
+
+class ConnectorRegistryTest(asynctest.TestCase):
+
+    def setUp(self):
+        self.registry = ConnectorRegistry()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_host_key(self):
+        assert get_host_key("https://apiv1.scribblelive.com/event/123?Token=foo") == "https://apiv1.scribblelive.com"
+        assert get_host_key("http://example.com:8080/v1/post") == "http://example.com:8080"
+
+    async def test_acquire_release(self):
+        settings = {"conn_limit": 20, "conn_limit_per_host": 5, "dns_cache_ttl": 60,
+                    "keepalive_timeout": 90, "event_id": 123}
+        connector = self.registry.acquire("https://example.com", settings)
+        assert connector.limit == 20
+        assert connector.limit_per_host == 5
+        assert self.registry.acquire("https://example.com") is connector
+        assert self.registry.stats() == {"https://example.com": 2}
+
+        await self.registry.release("https://example.com")
+        assert connector.closed == False
+        await self.registry.release("https://example.com")
+        assert connector.closed == True
+        assert self.registry.stats() == {}
+
+        # unknown host
+        await self.registry.release("https://example.com")
+        assert self.registry.stats() == {}
+
+    async def test_defaults(self):
+        connector = self.registry.acquire("https://example.com", {"conn_limit": None})
+        assert connector.limit == 100
+        assert connector.limit_per_host == 0
+        await self.registry.release("https://example.com")
+
+    async def test_get_keeps_references(self):
+        connector = self.registry.acquire("https://example.com")
+        assert self.registry.get("https://example.com") is connector
+        assert self.registry.stats() == {"https://example.com": 1}
+
+        # closed connector is replaced for the holders of references
+        closing = connector.close()
+        if closing is not None:
+            await closing
+        other = self.registry.get("https://example.com")
+        assert other is not connector
+        assert self.registry.stats() == {"https://example.com": 1}
+        await self.registry.release("https://example.com")
+        assert other.closed == True
+        assert self.registry.stats() == {}
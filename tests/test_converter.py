@@ -13,16 +13,73 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
+import hashlib
 import asynctest
 import os.path
+import shutil
+import tempfile
+import threading
+from concurrent.futures.process import BrokenProcessPool
 from livebridge_scribblelive import LiveblogScribbleliveConverter
+from livebridge_scribblelive.images import ImageCache
+from livebridge_scribblelive.converters import item_cache, oembed_cache, pending_oembeds, close_session, embed_providers
+from livebridge_scribblelive.converters import get_process_pool, shutdown_process_pool
+from livebridge_scribblelive.executor import get_executor
 from livebridge.base import ConversionResult
 from tests import load_json
 
+class TestContent:
+    __test__ = False
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def iter_chunked(self, size):
+        return TestChunks(self.chunks)
+
+
+class TestChunks:
+    __test__ = False
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0)
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class TestDownload:
+    __test__ = False
+
+    def __init__(self, chunks, status=200, content_length=None):
+        self.status = status
+        self.content_length = content_length
+        self.content = TestContent(chunks)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
 class LiveblogScribbleliveConverterTest(asynctest.TestCase):
 
     def setUp(self):
         self.converter = LiveblogScribbleliveConverter()
+        oembed_cache.clear()
+        item_cache.clear()
+
+    async def tearDown(self):
+        await close_session()
 
     @asynctest.skip("Skipped because unknown reasons")
     async def test_simple_conversion(self):
@@ -97,7 +154,6 @@ class LiveblogScribbleliveConverterTest(asynctest.TestCase):
         assert tmp_path == None
         assert content == ''
 
-    @asynctest.skip("Skipped for unknown reasons")
     async def test_embed_text(self):
         item = {"item": {"meta": {
                     "title": "Titel",
@@ -289,3 +345,365 @@ Bundesliga-Relegation live! Nürnberg vs Frankfurt - die Partie jetzt im LiveTic
             <br> &bull; drei<br> &bull; vier<br>
             <s>STRIKE</s>
             <div><b>bold</b><i>italic</i></div></p>"""
+
+    async def test_twitter_embed_cached(self):
+        self.converter._fetch_oembed = asynctest.CoroutineMock(return_value="<blockquote>Tweet</blockquote>")
+        res = await self.converter._get_twitter_embed("https://twitter.com/dpa_live/status/775991579676909568")
+        assert res == "<blockquote>Tweet</blockquote>"
+        res = await LiveblogScribbleliveConverter()._get_twitter_embed("https://Twitter.com/dpa_live/status/775991579676909568/")
+        assert res == "<blockquote>Tweet</blockquote>"
+        assert self.converter._fetch_oembed.call_count == 1
+        assert "dnt=1" in self.converter._fetch_oembed.call_args[0][0]
+        assert oembed_cache.stats()["hits"] == 1
+
+    async def test_oembed_failure_cached(self):
+        self.converter._fetch_oembed = asynctest.CoroutineMock(side_effect=Exception)
+        res = await self.converter._get_instagram_embed("https://www.instagram.com/p/BE5F7Jgxwe4/")
+        assert res == ""
+        res = await self.converter._get_instagram_embed("https://www.instagram.com/p/BE5F7Jgxwe4/")
+        assert res == ""
+        assert self.converter._fetch_oembed.call_count == 1
+
+        self.converter._fetch_oembed = asynctest.CoroutineMock(return_value=None)
+        res = await self.converter._get_twitter_embed("https://twitter.com/dpa_live/status/1")
+        assert res == ""
+
+    async def test_convert_embeds_concurrently(self):
+        refs = [{"item": {"item_type": "embed", "meta": {"title": str(i)}}} for i in range(6)]
+        refs.insert(2, {"item": {"item_type": "quote", "meta": {"quote": "Zitat"}}})
+        post = {"groups": [{"id": "main", "refs": refs}]}
+        running = []
+
+        async def convert_embed(item):
+            running.append(item)
+            assert len(running) <= 2
+            await asyncio.sleep(0.01 * (6 - int(item["item"]["meta"]["title"])))
+            running.remove(item)
+            return "<{}>".format(item["item"]["meta"]["title"])
+
+        self.converter.embed_concurrency = 2
+        self.converter._convert_embed = asynctest.CoroutineMock(side_effect=convert_embed)
+        conversion = await self.converter.convert(post)
+        assert conversion.content == "<0><1><blockquote>Zitat<br></blockquote><2><3><4><5>"
+        assert self.converter._convert_embed.call_count == 6
+
+    async def test_convert_embed_failing_keeps_order(self):
+        refs = [{"item": {"item_type": "embed", "meta": {"title": str(i)}}} for i in range(3)]
+        post = {"groups": [{"id": "main", "refs": refs}]}
+
+        async def convert_embed(item):
+            if item["item"]["meta"]["title"] == "1":
+                raise Exception("failed")
+            return "<{}>".format(item["item"]["meta"]["title"])
+
+        self.converter._convert_embed = asynctest.CoroutineMock(side_effect=convert_embed)
+        conversion = await self.converter.convert(post)
+        assert conversion.content == "<0>"
+
+    async def test_oembed_requests_deduplicated(self):
+        async def fetch(api_url):
+            await asyncio.sleep(0.01)
+            return "<blockquote>Tweet</blockquote>"
+
+        self.converter._fetch_oembed = asynctest.CoroutineMock(side_effect=fetch)
+        other = LiveblogScribbleliveConverter()
+        other._fetch_oembed = self.converter._fetch_oembed
+        url = "https://twitter.com/dpa_live/status/775991579676909568"
+        res = await asyncio.gather(
+            self.converter._get_twitter_embed(url),
+            self.converter._get_twitter_embed(url),
+            other._get_twitter_embed(url),
+            other._get_instagram_embed(url))
+        assert res == ["<blockquote>Tweet</blockquote>"] * 4
+        assert self.converter._fetch_oembed.call_count == 2
+        assert pending_oembeds == {}
+
+    async def test_convert_items_cached(self):
+        post = load_json('post_to_convert.json')
+        # without tweet
+        post["groups"][1]["refs"].pop()
+        conversion = await self.converter.convert(post)
+        assert item_cache.stats()["misses"] > 0
+        assert item_cache.stats()["hits"] == 0
+
+        self.converter._render_item = asynctest.Mock(return_value="changed")
+        cached = await LiveblogScribbleliveConverter().convert(post)
+        assert cached.content == conversion.content
+        assert item_cache.stats()["hits"] == 5
+
+        # edited text item is converted again
+        post["groups"][1]["refs"][0]["item"]["text"] = "Neuer Text"
+        conversion = await self.converter.convert(post)
+        assert self.converter._render_item.call_count == 1
+        assert conversion.content.startswith("changed")
+
+    async def test_oembed_items_not_cached(self):
+        item = {"item": {"item_type": "embed", "meta": {"provider_name": "Twitter", "original_url": "foo"}}}
+        self.converter._convert_embed = asynctest.CoroutineMock(return_value="<tweet>")
+        post = {"groups": [{"id": "main", "refs": [item]}]}
+        await self.converter.convert(post)
+        await self.converter.convert(post)
+        assert self.converter._convert_embed.call_count == 2
+        assert len(item_cache) == 0
+
+    async def test_download_image(self):
+        data = {"href": "https://example.com/image", "media": "foo/bar", "mimetype": "image/png"}
+        session = asynctest.MagicMock()
+        session.get.return_value = TestDownload([b"foo", b"baz"])
+        with asynctest.patch("livebridge_scribblelive.converters.get_session", return_value=session):
+            path = await self.converter._download_image(data)
+        assert os.path.basename(path).endswith("-bar.png")
+        with open(path, "rb") as image_file:
+            assert image_file.read() == b"foobaz"
+        assert session.get.call_args[0] == ("https://example.com/image",)
+        assert session.get.call_args[1]["timeout"].total == 30
+        await self.converter.remove_images([path])
+
+    async def test_download_image_failing(self):
+        data = {"href": "https://example.com/image.jpg", "media": "image.jpg"}
+        self.converter.image_max_size = 5
+        session = asynctest.MagicMock()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for download in [TestDownload([b"foo", b"baz"]), TestDownload([], content_length=6),
+                             TestDownload([b"foo"], status=404)]:
+                session.get.return_value = download
+                with asynctest.patch("livebridge_scribblelive.converters.get_session", return_value=session):
+                    with asynctest.patch("tempfile.gettempdir", return_value=tmp_dir):
+                        with self.assertRaises(Exception):
+                            await self.converter._download_image(data)
+                assert os.listdir(tmp_dir) == []
+
+    async def test_convert_upload_first_image(self):
+        post = load_json('post_to_convert.json')
+        refs = post["groups"][1]["refs"]
+        refs.pop()
+        images = [ref for ref in refs if ref["item"]["item_type"] == "image"]
+        refs.append(images[0])
+        self.converter.image_upload = True
+        self.converter._download_image = asynctest.CoroutineMock(return_value="/tmp/foobaz")
+        conversion = await self.converter.convert(post)
+        assert conversion.images == ["/tmp/foobaz"]
+        assert self.converter._download_image.call_count == 1
+        # second image is linked
+        assert conversion.content.count("<img ") == 1
+        assert "<br>Gähn <i>(Mich)</i><br>" in conversion.content
+
+        # falls back to linked image
+        self.converter._download_image = asynctest.CoroutineMock(side_effect=Exception)
+        conversion = await self.converter.convert(post)
+        assert conversion.images == []
+        assert conversion.content.count("<img ") == 2
+
+    async def test_convert_failing_removes_downloads(self):
+        image = {"item": {"item_type": "image", "meta": {}}}
+        embed = {"item": {"item_type": "embed", "meta": {"title": "foo"}}}
+        post = {"groups": [{"id": "main", "refs": [embed, image]}]}
+        self.converter.image_upload = True
+        self.converter._convert_embed = asynctest.CoroutineMock(side_effect=Exception("failed"))
+        self.converter._convert_image = asynctest.CoroutineMock(return_value=("", "/tmp/foobaz"))
+        self.converter.remove_images = asynctest.CoroutineMock()
+        conversion = await self.converter.convert(post)
+        assert conversion.content == ""
+        assert conversion.images == []
+        self.converter.remove_images.assert_called_once_with(["/tmp/foobaz"])
+
+    async def test_download_image_cached(self):
+        data = {"href": "https://example.com/image.jpg", "media": "image.jpg"}
+        session = asynctest.MagicMock()
+        session.get.return_value = TestDownload([b"foo", b"baz"])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ImageCache(os.path.join(tmp_dir, "images"))
+            with asynctest.patch("livebridge_scribblelive.converters.get_session", return_value=session):
+                with asynctest.patch("livebridge_scribblelive.converters.image_cache", cache):
+                    paths = []
+                    for _ in range(2):
+                        paths.append(await self.converter._download_image(data))
+            assert session.get.call_count == 1
+            assert paths[0] != paths[1]
+            for path in paths:
+                with open(path, "rb") as image_file:
+                    assert image_file.read() == b"foobaz"
+            digest = hashlib.sha256(b"foobaz").hexdigest()
+            assert cache.get_download(paths[1]) == (digest, data["href"])
+            with asynctest.patch("livebridge_scribblelive.converters.image_cache", cache):
+                await self.converter.remove_images(paths)
+            assert cache.get_download(paths[0]) is None
+            assert cache.stats()["files"] == 1
+            assert cache.stats()["uploads"] == 0
+
+    async def test_download_image_cached_in_thread(self):
+        data = {"href": "https://example.com/image.jpg", "media": "image.jpg"}
+        session = asynctest.MagicMock()
+        session.get.return_value = TestDownload([b"foo"])
+        threads = []
+
+        def link_file(src, dst):
+            threads.append(threading.current_thread())
+            shutil.copyfile(src, dst)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ImageCache(os.path.join(tmp_dir, "images"))
+            with asynctest.patch("livebridge_scribblelive.converters.get_session", return_value=session):
+                with asynctest.patch("livebridge_scribblelive.converters.image_cache", cache):
+                    with asynctest.patch("livebridge_scribblelive.images.link_file", side_effect=link_file):
+                        path = await self.converter._download_image(data)
+            assert len(threads) == 1
+            assert threads[0] in get_executor()._threads
+            assert cache.stats()["files"] == 1
+            await self.converter.remove_images([path])
+
+    async def test_convert_twitter_embed_with_iframe(self):
+        self.converter._get_twitter_embed = asynctest.CoroutineMock(return_value="<blockquote>Tweet</blockquote>")
+        item = {"item": {"meta": {
+            "provider_name": "Twitter",
+            "original_url": "https://twitter.com/dpa_live/status/775991579676909568",
+            "html": '<iframe src="https://twitter.com"></iframe>',
+        }}}
+        content = await self.converter._convert_embed(item)
+        assert content == "<blockquote>Tweet</blockquote>"
+
+    async def test_convert_registered_embed(self):
+        embed = '<iframe src="https://player.vimeo.com/video/123"></iframe>'
+        item = {"item": {"meta": {"html": embed, "title": "Video"}}}
+        assert await self.converter._convert_embed(item) == embed + "<br><div><strong>Video</strong></div>"
+
+        provider = embed_providers.register(
+            "vimeo", lambda converter, meta: "<vimeo>", html=[r"player\.vimeo\.com/video/\d+"])
+        try:
+            assert await self.converter._convert_embed(item) == "<vimeo><br><div><strong>Video</strong></div>"
+            assert embed_providers.stats()["vimeo"]["count"] == 1
+        finally:
+            embed_providers._by_html.remove(provider)
+
+    async def test_registered_embed_cached(self):
+        lookups = []
+
+        async def lookup(converter, meta):
+            lookups.append(meta)
+            return ""
+
+        item = {"item": {"item_type": "embed", "meta": {"provider_name": "Mastodon", "title": "Toot"}}}
+        semaphore = asyncio.Semaphore(1)
+        provider = embed_providers.register("mastodon", lookup, provider_name="Mastodon")
+        try:
+            for _ in range(2):
+                assert await self.converter._convert_item(item, semaphore) == \
+                    ("<br><div><strong>Toot</strong></div>", [])
+            assert len(lookups) == 2
+            assert len(item_cache) == 0
+
+            provider.cacheable = True
+            for _ in range(2):
+                await self.converter._convert_item(item, semaphore)
+            assert len(lookups) == 3
+            assert len(item_cache) == 1
+        finally:
+            del embed_providers._by_name["Mastodon"]
+
+    async def test_convert_many(self):
+        post = load_json('post_to_convert.json')
+        post["groups"][1]["refs"].pop()
+        expected = await self.converter.convert(post)
+        item_cache.clear()
+        other = {"groups": [{"id": "main", "refs": [{"item": {"item_type": "quote", "meta": {"quote": "Zitat"}}}]}]}
+        results = await self.converter.convert_many([post, other, {}])
+        assert [type(res) for res in results] == [ConversionResult] * 3
+        assert results[0].content == expected.content
+        assert results[1].content == "<blockquote>Zitat<br></blockquote>"
+        assert results[2].content == ""
+
+    async def test_convert_many_shares_embed_limit(self):
+        running = []
+
+        async def convert_embed(item):
+            running.append(item)
+            assert len(running) <= 2
+            await asyncio.sleep(0.01)
+            running.remove(item)
+            return "<embed>"
+
+        posts = [{"groups": [{"id": "main", "refs": [
+            {"item": {"item_type": "embed", "meta": {"title": str(i)}}},
+            {"item": {"item_type": "text", "text": "Text"}}]}]} for i in range(4)]
+        self.converter.embed_concurrency = 2
+        self.converter._convert_embed = asynctest.CoroutineMock(side_effect=convert_embed)
+        results = await self.converter.convert_many(posts)
+        assert [res.content for res in results] == ["<embed><p>Text</p>"] * 4
+
+    async def test_convert_in_process_pool(self):
+        post = load_json('post_to_convert.json')
+        post["groups"][1]["refs"].pop()
+        post["groups"][1]["refs"].append({"item": {"item_type": "testtype"}, "type": "test"})
+        expected = await self.converter.convert(post)
+        item_cache.clear()
+        self.converter.convert_processes = 2
+        try:
+            conversion = await self.converter.convert(post)
+            assert conversion.content == expected.content
+            assert item_cache.stats()["misses"] > 0
+            # served from item cache
+            post["groups"][1]["refs"].pop()
+            expected = await self.converter.convert(post)
+            with asynctest.patch("livebridge_scribblelive.converters.get_process_pool") as get_pool:
+                assert (await self.converter.convert(post)).content == expected.content
+            assert get_pool.call_count == 0
+        finally:
+            shutdown_process_pool()
+
+    async def test_convert_in_process_pool_failing(self):
+        refs = [{"item": {"item_type": "quote", "meta": {"quote": "Zitat"}}},
+                {"item": {"item_type": "text"}},
+                {"item": {"item_type": "quote", "meta": {"quote": "Zitat 2"}}}]
+        post = {"groups": [{"id": "main", "refs": refs}]}
+        self.converter.convert_processes = 1
+        try:
+            conversion = await self.converter.convert(post)
+            assert conversion.content == "<blockquote>Zitat<br></blockquote>"
+        finally:
+            shutdown_process_pool()
+
+        # falls back to rendering in process
+        with asynctest.patch("livebridge_scribblelive.converters.get_process_pool", side_effect=Exception):
+            item_cache.clear()
+            conversion = await self.converter.convert(post)
+            assert conversion.content == "<blockquote>Zitat<br></blockquote>"
+
+    async def test_convert_in_broken_process_pool(self):
+        post = {"groups": [{"id": "main", "refs": [{"item": {"item_type": "quote", "meta": {"quote": "Zitat"}}}]}]}
+        self.converter.convert_processes = 1
+        try:
+            pool = get_process_pool(1)
+            with self.assertRaises(BrokenProcessPool):
+                await asyncio.get_event_loop().run_in_executor(pool, os._exit, 1)
+
+            with self.assertLogs("livebridge_scribblelive.converters", level="WARNING") as logs:
+                conversion = await self.converter.convert(post)
+            assert conversion.content == "<blockquote>Zitat<br></blockquote>"
+            # rendered in the new pool, not in process after an error
+            assert [record.levelname for record in logs.records] == ["WARNING"]
+            assert get_process_pool(1) is not pool
+
+            # the new pool is kept
+            new_pool = get_process_pool(1)
+            item_cache.clear()
+            assert (await self.converter.convert(post)).content == "<blockquote>Zitat<br></blockquote>"
+            assert get_process_pool(1) is new_pool
+        finally:
+            shutdown_process_pool()
+
+    async def test_convert_large_text_in_thread(self):
+        threads = {}
+        render_item = self.converter._render_item
+
+        def render(item):
+            threads[item["item"]["text"]] = threading.current_thread()
+            return render_item(item)
+
+        refs = [{"item": {"item_type": "text", "text": "<p>{}</p>".format(text)}} for text in ["kurz", "x" * 30]]
+        post = {"groups": [{"id": "main", "refs": refs}]}
+        self.converter.offload_size = 20
+        self.converter._render_item = render
+        conversion = await self.converter.convert(post)
+        assert conversion.content == "<p>kurz</p><p>{}</p>".format("x" * 30)
+        assert threads["<p>kurz</p>"] is threading.current_thread()
+        assert threads["<p>{}</p>".format("x" * 30)] in get_executor()._threads
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+from livebridge_scribblelive.embeds import EmbedRegistry
+
+
+class TestConverter:
+    __test__ = False
+
+    def convert_foo(self, meta):
+        return "<foo>"
+
+    async def convert_bar(self, meta):
+        return "<bar>"
+
+
+class EmbedRegistryTest(asynctest.TestCase):
+
+    def setUp(self):
+        self.registry = EmbedRegistry()
+        self.registry.register("foo", "convert_foo", provider_name="Foo")
+        self.registry.register("iframe", lambda converter, meta: meta["html"], html=["<iframe "], fallback=True)
+
+    def test_match(self):
+        assert self.registry.match({"provider_name": "Foo"}).name == "foo"
+        assert self.registry.match({"html": "<iframe src=''>"}).name == "iframe"
+        assert self.registry.match({"html": None}) is None
+        assert self.registry.match({}) is None
+
+    def test_match_all_patterns(self):
+        self.registry.register("bar", "convert_bar", html=["example\\.com", "embed"])
+        assert self.registry.match({"html": "<iframe src='example.com/embed'>"}).name == "bar"
+        assert self.registry.match({"html": "<iframe src='example.com/video'>"}).name == "iframe"
+
+    def test_register_invalid(self):
+        with self.assertRaises(ValueError):
+            self.registry.register("foo", "convert_foo")
+
+    async def test_convert(self):
+        converter = TestConverter()
+        assert await self.registry.convert(self.registry.match({"provider_name": "Foo"}), converter, {}) == "<foo>"
+        provider = self.registry.register("bar", "convert_bar", provider_name="Bar")
+        assert await self.registry.convert(provider, converter, {}) == "<bar>"
+        html = "<iframe src=''>"
+        assert await self.registry.convert(self.registry.match({"html": html}), converter, {"html": html}) == html
+
+    def test_cacheable(self):
+        converter = TestConverter()
+        assert self.registry.match({"provider_name": "Foo"}).is_cacheable(converter) == True
+        assert self.registry.match({"html": "<iframe "}).is_cacheable(converter) == True
+        assert self.registry.register("bar", "convert_bar", provider_name="Bar").is_cacheable(converter) == False
+        provider = self.registry.register("baz", TestConverter.convert_bar, provider_name="Baz", cacheable=True)
+        assert provider.is_cacheable(converter) == True
+        provider = self.registry.register("qux", "convert_foo", provider_name="Qux", cacheable=False)
+        assert provider.is_cacheable(converter) == False
+
+    async def test_timings(self):
+        provider = self.registry.match({"provider_name": "Foo"})
+        await self.registry.convert(provider, TestConverter(), {})
+        with self.assertRaises(KeyError):
+            await self.registry.convert(self.registry.match({"html": "<iframe "}), TestConverter(), {})
+        stats = self.registry.stats()
+        assert stats["foo"]["count"] == 1
+        assert stats["foo"]["errors"] == 0
+        assert stats["foo"]["seconds"] >= 0
+        assert stats["iframe"]["errors"] == 1
+        self.registry.clear_stats()
+        assert self.registry.stats() == {}
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import threading
+from livebridge_scribblelive.executor import get_executor, run_blocking
+
+
+class ExecutorTest(asynctest.TestCase):
+
+    async def test_run_blocking(self):
+        thread = await run_blocking(threading.current_thread)
+        assert thread is not threading.current_thread()
+        assert thread in get_executor()._threads
+        assert await run_blocking(max, 1, 2) == 2
+
+    def test_executor_shared(self):
+        assert get_executor() is get_executor()
+        assert get_executor()._max_workers == 4
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import os
+import os.path
+import tempfile
+import unittest
+from livebridge_scribblelive.images import ImageCache, get_image_cache
+
+
+class ImageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "images")
+        self.cache = ImageCache(self.path, max_size=10)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _download(self, content):
+        filepath = os.path.join(self.tmp_dir.name, "download")
+        with open(filepath, "wb") as image_file:
+            image_file.write(content)
+        return filepath, hashlib.sha256(content).hexdigest()
+
+    def test_get_and_add(self):
+        assert self.cache.get("https://example.com/foo.jpg") is None
+        filepath, digest = self._download(b"foo")
+        self.cache.add("https://example.com/foo.jpg", filepath, digest)
+        os.remove(filepath)
+        assert self.cache.get("https://EXAMPLE.com/foo.jpg") == digest
+        with open(self.cache.get_path(digest), "rb") as image_file:
+            assert image_file.read() == b"foo"
+        assert self.cache.stats() == {"files": 1, "size": 3, "hits": 1, "misses": 1, "evicted": 0,
+                                      "uploads": 0, "duplicate_uploads": 0}
+
+    def test_same_content_stored_once(self):
+        filepath, digest = self._download(b"foo")
+        self.cache.add("https://example.com/foo.jpg", filepath, digest)
+        self.cache.add("https://example.com/other.jpg", filepath, digest)
+        assert self.cache.get("https://example.com/other.jpg") == digest
+        assert self.cache.stats()["files"] == 1
+        assert self.cache.stats()["size"] == 3
+
+    def test_persisted(self):
+        filepath, digest = self._download(b"foo")
+        self.cache.add("https://example.com/foo.jpg", filepath, digest)
+        assert ImageCache(self.path).get("https://example.com/foo.jpg") == digest
+
+    def test_lru_eviction(self):
+        for i, content in enumerate([b"aaaa", b"bbbb", b"cccc"]):
+            filepath, digest = self._download(content)
+            self.cache.add("https://example.com/{}.jpg".format(i), filepath, digest)
+            if i == 1:
+                assert self.cache.get("https://example.com/0.jpg") is not None
+        assert self.cache.get("https://example.com/0.jpg") is not None
+        assert self.cache.get("https://example.com/1.jpg") is None
+        assert self.cache.get("https://example.com/2.jpg") is not None
+        assert self.cache.stats()["evicted"] == 1
+        assert self.cache.stats()["size"] == 8
+        assert not os.path.exists(self.cache.get_path(hashlib.sha256(b"bbbb").hexdigest()))
+
+    def test_get_without_write(self):
+        filepath, digest = self._download(b"foo")
+        self.cache.add("https://example.com/foo.jpg", filepath, digest)
+        changes = self.cache._conn.total_changes
+        assert self.cache.get("https://example.com/foo.jpg") == digest
+        assert self.cache._conn.total_changes == changes
+        assert self.cache._accessed == {digest: self.cache._tick}
+        filepath, other = self._download(b"bar")
+        self.cache.add("https://example.com/bar.jpg", filepath, other)
+        assert self.cache._accessed == {}
+
+    def test_missing_file(self):
+        filepath, digest = self._download(b"foo")
+        self.cache.add("https://example.com/foo.jpg", filepath, digest)
+        os.remove(self.cache.get_path(digest))
+        assert self.cache.get("https://example.com/foo.jpg") is None
+        assert self.cache.stats()["files"] == 0
+
+    def test_record_upload(self):
+        filepath, digest = self._download(b"foo")
+        self.cache.add("https://example.com/foo.jpg", filepath, digest)
+        assert self.cache.record_upload(digest, "https://example.com/foo.jpg") == 1
+        with self.assertLogs("livebridge_scribblelive.images", level="INFO"):
+            assert self.cache.record_upload(digest, "https://example.com/foo.jpg") == 2
+        assert self.cache.stats()["uploads"] == 2
+        assert self.cache.stats()["duplicate_uploads"] == 1
+
+    def test_clear(self):
+        filepath, digest = self._download(b"foo")
+        self.cache.add("https://example.com/foo.jpg", filepath, digest)
+        self.cache.clear()
+        assert self.cache.stats()["files"] == 0
+        assert not os.path.exists(self.cache.get_path(digest))
+
+    def test_get_image_cache(self):
+        assert get_image_cache() is None
+        assert type(get_image_cache(self.path)) == ImageCache
+        assert get_image_cache("/dev/null/foo") is None
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+from livebridge_scribblelive.outbound import WriteQueue
+
+
+class WriteQueueTest(asynctest.TestCase):
+
+    def setUp(self):
+        self.queue = WriteQueue()
+        self.sent = []
+
+    def _send(self, name, delay=0.01):
+        async def send():
+            self.sent.append(name)
+            await asyncio.sleep(delay)
+            if name == "fail":
+                raise Exception(name)
+            return name
+        return send
+
+    async def test_order(self):
+        res = await asyncio.gather(
+            self.queue.put("a", "create", self._send("create")),
+            self.queue.put("b", "create", self._send("other", 0)),
+            self.queue.put("a", "delete", self._send("delete", 0)))
+        assert res == ["create", "other", "delete"]
+        assert self.sent == ["create", "other", "delete"]
+        assert len(self.queue) == 0
+        assert self.queue._workers == {}
+
+    async def test_coalesce_updates(self):
+        first = asyncio.ensure_future(self.queue.put("a", "update", self._send("update-1")))
+        await asyncio.sleep(0)
+        res = await asyncio.gather(
+            first,
+            self.queue.put("a", "update", self._send("update-2")),
+            self.queue.put("a", "update", self._send("update-3")),
+            self.queue.put("a", "update", self._send("update-4")))
+        assert self.sent == ["update-1", "update-4"]
+        assert res == ["update-1", "update-4", "update-4", "update-4"]
+        assert self.queue.coalesced == 2
+
+    async def test_delete_drops_updates(self):
+        res = await asyncio.gather(
+            self.queue.put("a", "create", self._send("create")),
+            self.queue.put("a", "update", self._send("update-1"), dropped="old"),
+            self.queue.put("a", "update", self._send("update-2"), dropped="old"),
+            self.queue.put("a", "delete", self._send("delete")))
+        assert self.sent == ["create", "delete"]
+        assert res == ["create", "old", "old", "delete"]
+
+    async def test_failure(self):
+        first = asyncio.ensure_future(self.queue.put("a", "update", self._send("fail")))
+        await asyncio.sleep(0)
+        res = await asyncio.gather(
+            first,
+            self.queue.put("a", "update", self._send("update")),
+            return_exceptions=True)
+        assert type(res[0]) == Exception
+        assert res[1] == "update"
+
+        # superseded updates get the error of the newer update
+        res = await asyncio.gather(
+            self.queue.put("a", "update", self._send("update")),
+            self.queue.put("a", "update", self._send("fail")),
+            return_exceptions=True)
+        assert type(res[0]) == Exception
+        assert type(res[1]) == Exception
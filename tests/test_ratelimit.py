@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import time
+from email.utils import formatdate
+from livebridge_scribblelive.ratelimit import RateLimiter, get_rate_limiter, parse_retry_after
+
+
+class RateLimiterTest(asynctest.TestCase):
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_parse_retry_after(self):
+        assert parse_retry_after("10") == 10
+        assert parse_retry_after("-1") == 0
+        assert parse_retry_after(None) == 5
+        assert parse_retry_after("foo", default=3) == 3
+        assert 25 < parse_retry_after(formatdate(time.time()+30, usegmt=True)) <= 30
+        assert parse_retry_after(formatdate(time.time()-30, usegmt=True)) == 0
+
+    async def test_acquire(self):
+        limiter = RateLimiter(rate=100, burst=2)
+        start = time.monotonic()
+        for _ in range(4):
+            await limiter.acquire()
+        assert 0.015 < time.monotonic() - start < 0.1
+
+    async def test_acquire_unlimited(self):
+        limiter = RateLimiter()
+        start = time.monotonic()
+        for _ in range(100):
+            await limiter.acquire()
+        assert time.monotonic() - start < 0.01
+
+    async def test_pause(self):
+        limiter = RateLimiter()
+        limiter.pause(0.05)
+        assert limiter.paused == True
+        assert limiter.throttled == 1
+        start = time.monotonic()
+        await limiter.acquire()
+        assert time.monotonic() - start >= 0.04
+        assert limiter.paused == False
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_shared_by_api_key(self):
+        limiter = get_rate_limiter("key-1", 10)
+        assert get_rate_limiter("key-1") is limiter
+        assert get_rate_limiter("key-2") is not limiter
+        assert limiter.rate == 10
+        assert limiter.capacity == 10
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import aiohttp
+import asyncio
+import asynctest
+import time
+from livebridge_scribblelive.common import ScribbleLiveException
+from livebridge_scribblelive.retry import RetryPolicy
+
+
+class RetryPolicyTest(asynctest.TestCase):
+
+    def setUp(self):
+        self.policy = RetryPolicy(retries=3, base_delay=1, max_delay=3, deadline=10)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_is_retryable(self):
+        connect_error = aiohttp.ClientConnectorError(asynctest.MagicMock(), OSError(111, "refused"))
+        assert self.policy.is_retryable(connect_error) == True
+        assert self.policy.is_retryable(connect_error, idempotent=False) == True
+        assert self.policy.is_retryable(aiohttp.ServerDisconnectedError()) == True
+        assert self.policy.is_retryable(aiohttp.ServerDisconnectedError(), idempotent=False) == False
+        assert self.policy.is_retryable(asyncio.TimeoutError()) == True
+        assert self.policy.is_retryable(ScribbleLiveException("foo", status=502)) == True
+        assert self.policy.is_retryable(ScribbleLiveException("foo", status=502), idempotent=False) == False
+        assert self.policy.is_retryable(ScribbleLiveException("foo", status=404)) == False
+        assert self.policy.is_retryable(ValueError()) == False
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_delay(self):
+        started = time.monotonic()
+        for _ in range(20):
+            assert 0 <= self.policy.get_delay(0, started) <= 1
+            assert 0 <= self.policy.get_delay(1, started) <= 2
+            assert 0 <= self.policy.get_delay(2, started) <= 3
+        assert self.policy.get_delay(3, started) is None
+        # deadline exceeded
+        assert self.policy.get_delay(0, started-10) is None
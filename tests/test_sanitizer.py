@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import unittest
+from livebridge_scribblelive import sanitizer
+from livebridge_scribblelive.sanitizer import clean_text
+
+
+class SanitizerTest(unittest.TestCase):
+
+    def test_clean_text(self):
+        assert clean_text(" <p>Text <strike>alt</strike></p> ") == "<p>Text <s>alt</s></p>"
+        assert clean_text("<ol><li>eins</li></ol>") == "<p><br> &bull; eins<br></p>"
+        assert clean_text('<h1>Titel</h1><a href="http://dpa.de" onclick="x">Link</a><script>x</script>') == \
+            '<p>Titel<a href="http://dpa.de">Link</a>x</p>'
+
+    def test_rewrite_single_pass(self):
+        assert clean_text("Text <stri</li>ke>alt</strike>") == "<p>Text alt</p>"
+        assert clean_text("<l<ol>i>eins</li>") == "<p>eins</p>"
+
+    def test_empty_paragraphs_removed(self):
+        assert clean_text("") == ""
+        assert clean_text("<p><br></p>") == ""
+        assert clean_text("<span></span>") == ""
+
+    def test_cleaner_reused(self):
+        cleaner = sanitizer.get_cleaner()
+        clean_text("<p>eins</p>")
+        assert sanitizer.get_cleaner() is cleaner
+
+    def test_cleaner_per_thread(self):
+        cleaners = []
+        thread = threading.Thread(target=lambda: cleaners.append(sanitizer.get_cleaner()))
+        thread.start()
+        thread.join()
+        assert cleaners[0] is not sanitizer.get_cleaner()
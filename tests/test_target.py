@@ -13,21 +13,36 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
+import gc
 import asynctest
 import aiohttp
+import json
+import os.path
+import tempfile
 import time
-from livebridge.base import BaseTarget, BasePost, TargetResponse
+from functools import partial
+from livebridge.base import BaseTarget, BasePost, ConversionResult, TargetResponse
 from livebridge_scribblelive import ScribbleLiveTarget
-from livebridge_scribblelive.common import ScribbleLiveClient, ScribbleLiveException
+from livebridge_scribblelive.common import ScribbleLiveClient, ScribbleLiveException, _refreshers
+from livebridge_scribblelive.circuitbreaker import _breakers, get_circuit_breaker, get_circuit_states
+from livebridge_scribblelive.common import CircuitOpenException
+from livebridge_scribblelive.connections import registry
+from livebridge_scribblelive.images import ImageCache
+from livebridge_scribblelive.ratelimit import RateLimiter
+from livebridge_scribblelive.retry import RetryPolicy
+from livebridge_scribblelive.outbound import WriteQueue
+from livebridge_scribblelive.tokens import MemoryTokenStore, pending_logins
 from tests import load_json
 
 
 class TestResponse:
     __test__ = False
 
-    def __init__(self, url, data={}, status=200):
+    def __init__(self, url, data={}, status=200, headers={}):
         self.status = status
         self.data = data
+        self.headers = headers
 
     async def __aenter__(self):
         return self
@@ -60,6 +75,14 @@ class ScribbleLiveTargetTests(asynctest.TestCase):
                         "auth": {"api_key": self.api_key, "user": self.user, "password": self.password},
                         "event_id": self.event_id, "endpoint": self.endpoint, "endpoint_v1": self.endpoint_v1})
 
+        self.client.token_store = MemoryTokenStore()
+        _breakers.clear()
+        pending_logins.clear()
+        _refreshers.clear()
+
+    async def tearDown(self):
+        await self.client.close()
+
     @asynctest.fail_on(unused_loop=False)
     def test_init(self):
         assert self.client.type == "scribble"
@@ -147,6 +170,31 @@ class ScribbleLiveTargetTests(asynctest.TestCase):
         assert resp == api_res
         self.client._post.assert_called_once_with('https://example.com/api/event/12345?', [], u'Test, mit Ü.')
 
+    async def test_post_item_records_upload(self):
+        self.client._check_login = asynctest.CoroutineMock(return_value=None)
+        self.client._post = asynctest.CoroutineMock(return_value={"Id": 1})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ImageCache(os.path.join(tmp_dir, "images"))
+            image = os.path.join(tmp_dir, "image.jpg")
+            with open(image, "wb") as image_file:
+                image_file.write(b"foo")
+            cache.add("https://example.com/image.jpg", image, "abc")
+            cache.track(image, "abc", "https://example.com/image.jpg")
+            post = asynctest.MagicMock(images=[image], content="foo")
+            with asynctest.patch("livebridge_scribblelive.converters.image_cache", cache):
+                await self.client._post_item(post)
+                assert cache.stats()["uploads"] == 1
+
+                # failed create isn't counted
+                self.client._post.return_value = {}
+                await self.client._post_item(post)
+                assert cache.stats()["uploads"] == 1
+
+                self.client._post.return_value = {"Id": 2}
+                await self.client._post_item(post)
+            assert cache.stats()["uploads"] == 2
+            assert cache.stats()["duplicate_uploads"] == 1
+
     async def test_update_item(self):
         api_res = {'IsComment': 0, 'Source': '',
                    'Creator': {'Id': 53620032, 'Avatar': '', 'Name': 'Martin Borho'},
@@ -297,6 +345,39 @@ class ScribbleLiveTargetTests(asynctest.TestCase):
         assert res == False
         assert self.client._check_login.call_count == 0
 
+    async def test_handle_post_removes_images(self):
+        converter = asynctest.MagicMock()
+        converter.remove_images = asynctest.CoroutineMock(side_effect=lambda images: [os.remove(i) for i in images])
+        self.client._db_client = asynctest.MagicMock()
+        self.client._db_client.get_post = asynctest.CoroutineMock(return_value={"target_doc": {"Id": 1}})
+        self.client._db_client.delete_post = asynctest.CoroutineMock()
+        self.client._get = asynctest.CoroutineMock(return_value={"Id": 1, "IsDeleted": 1})
+        self.client._check_login = asynctest.CoroutineMock(return_value=None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for action, content in [("delete", "foo"), ("ignore", "foo"), ("create", "")]:
+                image = os.path.join(tmp_dir, "image.jpg")
+                open(image, "wb").close()
+                converter.convert = asynctest.CoroutineMock(
+                    return_value=ConversionResult(content=content, images=[image]))
+                post = asynctest.MagicMock()
+                post.is_deleted = action == "delete"
+                post.get_action.return_value = action
+                post.target_doc = {"Id": 1}
+                with asynctest.patch("livebridge.base.targets.get_converter", return_value=converter):
+                    assert await self.client.handle_post(post) is None
+                assert not os.path.exists(image)
+            assert self.client._db_client.delete_post.call_count == 1
+
+            # publishing failed
+            open(image, "wb").close()
+            converter.convert.return_value = ConversionResult(content="foo", images=[image])
+            post.get_action.return_value = "create"
+            self.client.post_item = asynctest.CoroutineMock(side_effect=ScribbleLiveException("failed"))
+            with asynctest.patch("livebridge.base.targets.get_converter", return_value=converter):
+                with self.assertRaises(ScribbleLiveException):
+                    await self.client.handle_post(post)
+            assert not os.path.exists(image)
+
     async def test_common_put(self):
         data = {"foo": "bla"}
         with asynctest.patch("aiohttp.client.ClientSession.put") as patched:
@@ -338,3 +419,442 @@ class ScribbleLiveTargetTests(asynctest.TestCase):
             # failing
             with self.assertRaises(ScribbleLiveException):
                 await self.client._get("https://dpa.com/resource", status=404)
+
+    async def test_session_reused(self):
+        session = self.client._get_session("https://example.com/api/foo")
+        assert type(session) == aiohttp.ClientSession
+        assert self.client._get_session("https://example.com/api/bar") is session
+        assert self.client._get_session("https://example2.com/api/bar") is not session
+        assert registry.stats() == {"https://example.com": 1, "https://example2.com": 1}
+
+        # closed session is replaced, keeping the reference
+        connector = session.connector
+        await session.close()
+        new_session = self.client._get_session("https://example.com/api/foo")
+        assert new_session is not session
+        assert new_session.connector is connector
+        assert registry.stats() == {"https://example.com": 1, "https://example2.com": 1}
+        session = new_session
+
+        await self.client.close()
+        assert session.closed == True
+        assert self.client._sessions == {}
+        assert registry.stats() == {}
+        await self.client.close()
+
+    async def test_connector_shared(self):
+        other = ScribbleLiveTarget(config={"auth": {"api_key": "foo"}, "event_id": 54321, "endpoint": self.endpoint})
+        session = self.client._get_session("https://example.com/api/foo")
+        other_session = other._get_session("https://example.com/api/foo")
+        assert session is not other_session
+        assert session.connector is other_session.connector
+        assert registry.stats() == {"https://example.com": 2}
+
+        await other.close()
+        assert registry.stats() == {"https://example.com": 1}
+        assert session.connector.closed == False
+        connector = session.connector
+        await self.client.close()
+        assert connector.closed == True
+
+    async def test_check_login_concurrent(self):
+        async def login():
+            await asyncio.sleep(0.01)
+            return "authed"
+        self.client._login = asynctest.CoroutineMock(side_effect=login)
+        res = await asyncio.gather(*[self.client._check_login() for _ in range(5)])
+        assert res == ["authed"] * 5
+        assert self.client._login.call_count == 1
+        assert pending_logins == {}
+
+        assert self.client.auth_token == "authed"
+
+        # failing login reaches all callers
+        self.client.auth_token = None
+        self.client._login = asynctest.CoroutineMock(side_effect=ScribbleLiveException)
+        res = await asyncio.gather(*[self.client._check_login() for _ in range(3)], return_exceptions=True)
+        assert all(type(r) == ScribbleLiveException for r in res)
+        assert self.client._login.call_count == 1
+        assert pending_logins == {}
+
+    async def test_check_login_concurrent_targets(self):
+        clients = [self.client] + [ScribbleLiveTarget(config={
+            "auth": {"api_key": self.api_key, "user": self.user, "password": self.password},
+            "event_id": event_id, "endpoint": self.endpoint}) for event_id in range(4)]
+        for client in clients:
+            client.token_store = self.client.token_store
+        logins = []
+
+        async def login(client):
+            logins.append(client)
+            await asyncio.sleep(0.01)
+            client.auth_token = "authed"
+            client.auth_time = time.time()
+            client.token_store.set(self.endpoint, self.user, "authed", client.auth_time)
+            return "authed"
+
+        for client in clients:
+            client._login = asynctest.CoroutineMock(side_effect=partial(login, client))
+        try:
+            res = await asyncio.gather(*[client._check_login() for client in clients])
+            assert res == ["authed"] * 5
+            assert len(logins) == 1
+            assert [client.auth_token for client in clients] == ["authed"] * 5
+            assert pending_logins == {}
+        finally:
+            for client in clients[1:]:
+                await client.close()
+
+    async def test_check_login_shared_token(self):
+        self.client.token_store.set(self.endpoint, self.user, "shared", time.time()-100)
+        self.client._login = asynctest.CoroutineMock(return_value="authed")
+        res = await self.client._check_login()
+        assert res == "shared"
+        assert self.client.auth_token == "shared"
+        assert self.client._login.call_count == 0
+
+        # expired token in store
+        self.client.auth_token = None
+        self.client.token_store.set(self.endpoint, self.user, "shared", time.time()-3610)
+        res = await self.client._check_login()
+        assert res == "authed"
+        assert self.client._login.call_count == 1
+
+    async def test_login_stores_token(self):
+        self.client._get = asynctest.CoroutineMock(return_value={"Auth": "foobaz"})
+        await self.client._login()
+        assert self.client.token_store.get(self.endpoint, self.user)[0] == "foobaz"
+
+        self.client._get = asynctest.CoroutineMock(return_value={})
+        await self.client._login()
+        assert self.client.token_store.get(self.endpoint, self.user) is None
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_url_params_without_auth(self):
+        self.client.auth_token = "foo"
+        url = self.client._add_url_params("http://test.com/foo?", with_auth=False)
+        assert url == "http://test.com/foo?Token=baz&format=json"
+
+    async def test_login_keeps_token(self):
+        self.client.auth_token = "old"
+        self.client._get = asynctest.CoroutineMock(side_effect=ScribbleLiveException)
+        with self.assertRaises(ScribbleLiveException):
+            await self.client._login()
+        assert self.client.auth_token == "old"
+
+    async def test_token_refresh(self):
+        self.client.token_refresh_margin = 300
+        self.client.token_refresh_retry = 0.01
+        self.client.auth_token = "old"
+        self.client.auth_time = time.time()-3600+300
+
+        async def login():
+            if self.client._login.call_count == 1:
+                raise ScribbleLiveException()
+            self.client.auth_token = "new"
+            self.client.auth_time = time.time()
+            return "new"
+        self.client._login = asynctest.CoroutineMock(side_effect=login)
+        self.client._start_token_refresh()
+        await asyncio.sleep(0.05)
+        assert self.client._login.call_count == 2
+        assert self.client.auth_token == "new"
+        state = self.client.get_refresh_state()
+        assert state["enabled"] == True
+        assert state["failures"] == 0
+        assert state["last_error"] == "ScribbleLiveException()"
+        assert state["last_refresh"] is not None
+
+        task = self.client._refresher._task
+        await self.client.close()
+        await asyncio.sleep(0)
+        assert task.cancelled() == True
+
+    async def test_token_refresh_disabled(self):
+        self.client.auth_token = "foo"
+        self.client._start_token_refresh()
+        assert self.client._refresher is None
+        assert self.client.get_refresh_state()["enabled"] == False
+
+    async def test_token_refresh_shared(self):
+        clients = [self.client] + [ScribbleLiveTarget(config={
+            "auth": {"api_key": self.api_key, "user": self.user, "password": self.password},
+            "event_id": event_id, "endpoint": self.endpoint, "token_refresh_margin": 300})
+            for event_id in range(4)]
+        self.client.token_refresh_margin = 300
+        auth_time = time.time()-3600+300
+        logins = []
+
+        async def login(client):
+            logins.append(client)
+            await asyncio.sleep(0.01)
+            client.auth_token = "new"
+            client.auth_time = time.time()
+            return "new"
+
+        for client in clients:
+            client.token_store = self.client.token_store
+            client.auth_token, client.auth_time = "old", auth_time
+            client._login = asynctest.CoroutineMock(side_effect=partial(login, client))
+            client._start_token_refresh()
+        try:
+            assert len(_refreshers) == 1
+            await asyncio.sleep(0.05)
+            assert len(logins) == 1
+            assert [client.auth_token for client in clients] == ["new"] * 5
+            assert all(client.get_refresh_state()["last_refresh"] for client in clients)
+        finally:
+            for client in clients[1:]:
+                await client.close()
+
+    async def test_token_refresh_stops_without_clients(self):
+        other = ScribbleLiveTarget(config={"auth": {"api_key": self.api_key, "user": "other"},
+                                           "endpoint": self.endpoint, "token_refresh_margin": 300})
+        other.auth_token, other.auth_time = "old", time.time()-3600+300+0.02
+        other._login = asynctest.CoroutineMock(return_value="new")
+        other._start_token_refresh()
+        refresher = other._refresher
+        task = refresher._task
+        await asyncio.sleep(0)
+
+        # livebridge drops targets of removed bridges without closing them
+        login = other._login
+        del other
+        gc.collect()
+        assert len(refresher._clients) == 0
+        await asyncio.sleep(0.05)
+        assert task.done() == True
+        assert login.call_count == 0
+
+    async def test_update_item_unchanged(self):
+        self.client._put = asynctest.CoroutineMock(return_value={"Id": 252686461, "Content": "Test"})
+        self.client._post = asynctest.CoroutineMock(return_value={"Id": 252686461, "Content": "Test"})
+        self.client.auth_time = time.time()-10
+        self.client.auth_token = "foobaz"
+
+        post = asynctest.MagicMock()
+        post.images = ["tests/test.jpg"]
+        post.content = "Test"
+        await self.client.post_item(post)
+
+        post.target_doc = {"Id": 252686461, "Content": "Test"}
+        resp = await self.client.update_item(post)
+        assert type(resp) == TargetResponse
+        assert resp == post.target_doc
+        assert self.client._put.call_count == 0
+        assert self.client.skipped_updates == 1
+
+        post.content = "Test, geändert"
+        await self.client.update_item(post)
+        await self.client.update_item(post)
+        assert self.client._put.call_count == 1
+        assert self.client.skipped_updates == 2
+
+        # after delete
+        self.client._get = asynctest.CoroutineMock(return_value={"Id": 252686461, "IsDeleted": 1})
+        await self.client.delete_item(post)
+        await self.client.update_item(post)
+        assert self.client._put.call_count == 2
+
+    async def test_update_item_forced(self):
+        self.client.force_updates = True
+        self.client._put = asynctest.CoroutineMock(return_value={"Id": 252686461})
+        self.client.auth_time = time.time()-10
+        self.client.auth_token = "foobaz"
+
+        post = asynctest.MagicMock()
+        post.target_doc = {"Id": 252686461}
+        post.images = []
+        post.content = "Test"
+        await self.client.update_item(post)
+        await self.client.update_item(post)
+        assert self.client._put.call_count == 2
+        assert self.client.skipped_updates == 0
+        assert ScribbleLiveTarget(config={"force_updates": True}).force_updates == True
+
+    async def test_common_throttled(self):
+        data = {"foo": "bla"}
+        self.client._rate_limiter = RateLimiter()
+        with asynctest.patch("aiohttp.client.ClientSession.get") as patched:
+            patched.side_effect = [
+                TestResponse(url="http://foo.com", status=429, headers={"Retry-After": "0.01"}),
+                TestResponse(url="http://foo.com", data=data)]
+            res = await self.client._get("https://dpa.com/resource")
+            assert res == data
+            assert patched.call_count == 2
+            assert self.client._rate_limiter.throttled == 1
+
+            # too many retries
+            self.client.max_throttle_retries = 1
+            patched.side_effect = [
+                TestResponse(url="http://foo.com", status=429, headers={"Retry-After": "0"})] * 2
+            with self.assertRaises(ScribbleLiveException):
+                await self.client._get("https://dpa.com/resource")
+
+    async def test_common_post_throttled(self):
+        self.client._rate_limiter = RateLimiter()
+        with asynctest.patch("aiohttp.client.ClientSession.post") as patched:
+            patched.side_effect = [
+                TestResponse(url="http://foo.com", status=429, headers={"Retry-After": "0"}),
+                TestResponse(url="http://foo.com", data={"Id": 1})]
+            res = await self.client._post("https://dpa.com/resource", images=["tests/test.jpg"])
+            assert res == {"Id": 1}
+            assert patched.call_args_list[0][1]["data"] is not patched.call_args_list[1][1]["data"]
+
+    async def test_common_retried(self):
+        self.client.retry_policy = RetryPolicy(base_delay=0.001)
+        with asynctest.patch("aiohttp.client.ClientSession.put") as patched:
+            patched.side_effect = [
+                TestResponse(url="http://foo.com", status=502),
+                aiohttp.ServerDisconnectedError(),
+                TestResponse(url="http://foo.com", data={"Id": 1})]
+            res = await self.client._put("https://dpa.com/resource", "foo")
+            assert res == {"Id": 1}
+            assert patched.call_count == 3
+
+        with asynctest.patch("aiohttp.client.ClientSession.get") as patched:
+            patched.return_value = TestResponse(url="http://foo.com", status=503)
+            with self.assertRaises(ScribbleLiveException):
+                await self.client._get("https://dpa.com/resource")
+            assert patched.call_count == 4
+
+    async def test_common_post_not_retried(self):
+        self.client.retry_policy = RetryPolicy(base_delay=0.001)
+        with asynctest.patch("aiohttp.client.ClientSession.post") as patched:
+            patched.side_effect = [
+                aiohttp.ClientConnectorError(asynctest.MagicMock(), OSError(111, "refused")),
+                TestResponse(url="http://foo.com", status=502)]
+            with self.assertRaises(ScribbleLiveException):
+                await self.client._post("https://dpa.com/resource", content="foo")
+            assert patched.call_count == 2
+
+    async def test_common_circuit_open(self):
+        self.client.breaker_settings = {"breaker_min_requests": 2, "breaker_reset_timeout": 60}
+        self.client.retry_policy = RetryPolicy(retries=0)
+        with asynctest.patch("aiohttp.client.ClientSession.get") as patched:
+            patched.return_value = TestResponse(url="http://foo.com", status=502)
+            for _ in range(2):
+                with self.assertRaises(ScribbleLiveException):
+                    await self.client._get("https://dpa.com/resource")
+            assert get_circuit_states()["https://dpa.com"]["state"] == "open"
+
+            with self.assertRaises(CircuitOpenException):
+                await self.client._get("https://dpa.com/resource")
+            assert patched.call_count == 2
+
+            # other hosts are not affected
+            patched.return_value = TestResponse(url="http://foo.com", data={})
+            assert await self.client._get("https://example.com/resource") == {}
+
+    async def test_common_circuit_open_not_limited(self):
+        self.client.breaker_settings = {"breaker_min_requests": 1, "breaker_reset_timeout": 60}
+        get_circuit_breaker("https://dpa.com", self.client.breaker_settings).record(False)
+        self.client._rate_limiter = RateLimiter(rate=0.01, burst=1)
+        with asynctest.patch("aiohttp.client.ClientSession.get") as patched:
+            # bucket with a token left
+            with self.assertRaises(CircuitOpenException):
+                await self.client._get("https://dpa.com/resource")
+            assert self.client._rate_limiter._tokens == 1
+
+            # paused bucket doesn't delay the rejection
+            with asynctest.patch.object(self.client._rate_limiter, "_tokens", 0):
+                self.client._rate_limiter.pause(60)
+                with self.assertRaises(CircuitOpenException):
+                    await asyncio.wait_for(self.client._get("https://dpa.com/resource"), 1)
+            assert patched.call_count == 0
+
+    async def test_write_queue(self):
+        client = ScribbleLiveTarget(config={"event_id": 12345, "write_queue": True})
+        assert type(client._write_queue) == WriteQueue
+        assert self.client._write_queue is None
+        client._post_item = asynctest.CoroutineMock(return_value={"Id": 1})
+        client._update_item = asynctest.CoroutineMock(return_value={"Id": 1})
+        client._delete_item = asynctest.CoroutineMock(return_value={"Id": 1, "IsDeleted": 1})
+
+        post = asynctest.MagicMock()
+        post.id = "foo"
+        post.target_doc = {"Id": 1}
+        res = await asyncio.gather(
+            client.post_item(post), client.update_item(post), client.update_item(post), client.delete_item(post))
+        assert res == [{"Id": 1}, {"Id": 1}, {"Id": 1}, {"Id": 1, "IsDeleted": 1}]
+        assert type(res[1]) == TargetResponse
+        assert client._update_item.call_count == 0
+        client._delete_item.assert_called_once_with(post)
+
+    async def test_backfill(self):
+        published = []
+
+        failing = {3}
+
+        async def handle_post(post):
+            await asyncio.sleep(0.001 * (5 - post.id))
+            conversion = await self.client._get_converter(post).convert(post.data)
+            assert conversion.content == "foo {}".format(post.id)
+            if post.id in failing:
+                raise Exception("failed")
+            published.append(post.id)
+
+        async def convert(data):
+            return ConversionResult(content="foo {}".format(data))
+
+        converter = asynctest.MagicMock()
+        converter.convert = asynctest.CoroutineMock(side_effect=convert)
+        converter.remove_images = asynctest.CoroutineMock()
+        self.client.handle_post = asynctest.CoroutineMock(side_effect=handle_post)
+        patched = asynctest.patch("livebridge.base.targets.get_converter", return_value=converter)
+        patched.start()
+        self.addCleanup(patched.stop)
+        posts = []
+        for i in range(5):
+            post = asynctest.MagicMock()
+            post.id = i
+            post.data = i
+            posts.append(post)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint = os.path.join(tmp_dir, "checkpoint.json")
+            stats = await self.client.backfill(posts, concurrency=2, checkpoint=checkpoint)
+            assert published == [0, 1, 2, 4]
+            assert converter.convert.call_count == 5
+            assert stats["posts"] == 5
+            assert stats["published"] == 4
+            assert stats["failed"] == 1
+            assert stats["failed_ids"] == [3]
+            assert stats["posts_per_second"] > 0
+            assert json.load(open(checkpoint)) == {"count": 5, "post_id": 4, "target_id": self.client.target_id,
+                                                   "failed_ids": [3]}
+            assert self.client._prepared == {}
+
+            # resume from checkpoint with async iterator
+            class Posts:
+                def __init__(self, posts):
+                    self.posts = iter(posts)
+                def __aiter__(self):
+                    return self
+                async def __anext__(self):
+                    try:
+                        return next(self.posts)
+                    except StopIteration:
+                        raise StopAsyncIteration
+
+            failing.clear()
+            post = asynctest.MagicMock()
+            post.id = 5
+            post.data = 5
+            stats = await self.client.backfill(Posts(posts + [post]), checkpoint=checkpoint)
+            assert published == [0, 1, 2, 4, 3, 5]
+            assert converter.convert.call_count == 7
+            assert stats["skipped"] == 4
+            assert stats["published"] == 2
+            assert json.load(open(checkpoint))["failed_ids"] == []
+
+    async def test_common_post_upload_limit(self):
+        self.client.max_upload_size = 1000
+        with asynctest.patch("aiohttp.client.ClientSession.post") as patched:
+            with self.assertRaises(ScribbleLiveException):
+                await self.client._post("https://dpa.com/resource", images=["tests/test.jpg"])
+            assert patched.call_count == 0
+
+            patched.return_value = TestResponse(url="http://foo.com", data={"Id": 1})
+            res = await self.client._post("https://dpa.com/resource", images=[b"foobaz"], content="foo")
+            assert res == {"Id": 1}
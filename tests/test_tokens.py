@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import os.path
+import tempfile
+import time
+from livebridge_scribblelive.tokens import MemoryTokenStore, FileTokenStore, SqliteTokenStore, get_token_store
+
+
+class TokenStoreTest(asynctest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _check_store(self, store):
+        now = time.time()
+        assert store.get("https://example.com", "foo") is None
+        store.set("https://example.com", "foo", "token", now)
+        assert tuple(store.get("https://example.com", "foo")) == ("token", now)
+        assert store.get("https://example.com", "bar") is None
+        assert store.get("https://example2.com", "foo") is None
+
+        # expired
+        store.set("https://example.com", "bar", "token", now-3601)
+        assert store.get("https://example.com", "bar") is None
+
+        store.delete("https://example.com", "foo")
+        assert store.get("https://example.com", "foo") is None
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_memory_store(self):
+        self._check_store(MemoryTokenStore())
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_file_store(self):
+        path = os.path.join(self.tmp_dir.name, "tokens.json")
+        self._check_store(FileTokenStore(path))
+        FileTokenStore(path).set("https://example.com", "foo", "token", 1234.5)
+        assert FileTokenStore(path)._tokens["https://example.com|foo"] == ("token", 1234.5)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_sqlite_store(self):
+        path = os.path.join(self.tmp_dir.name, "tokens.db")
+        self._check_store(SqliteTokenStore(path))
+        SqliteTokenStore(path).set("https://example.com", "foo", "token", time.time())
+        assert SqliteTokenStore(path).get("https://example.com", "foo")[0] == "token"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_token_store(self):
+        store = get_token_store()
+        assert type(store) == MemoryTokenStore
+        assert get_token_store("memory") is store
+        path = os.path.join(self.tmp_dir.name, "tokens.db")
+        assert type(get_token_store("sqlite", path)) == SqliteTokenStore
+        with self.assertRaises(ValueError):
+            get_token_store("foo")
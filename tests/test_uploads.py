@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import io
+import os.path
+from aiohttp.payload import BytesPayload
+from livebridge_scribblelive.uploads import FilePayload, Upload
+
+IMAGE = os.path.join(os.path.dirname(__file__), "test.jpg")
+
+
+class TestWriter:
+    __test__ = False
+
+    def __init__(self, fail=False):
+        self.chunks = []
+        self.fail = fail
+
+    async def write(self, chunk):
+        if self.fail:
+            raise ConnectionResetError()
+        self.chunks.append(chunk)
+
+
+class UploadTest(asynctest.TestCase):
+
+    async def test_file_upload(self):
+        upload = Upload(IMAGE)
+        assert upload.in_memory == False
+        assert upload.filename == "test.jpg"
+        assert await upload.prepare() == 105516
+
+        payload = upload.get_payload("image/jpeg")
+        assert type(payload) == FilePayload
+        assert payload.size == 105516
+        assert payload.content_type == "image/jpeg"
+        writer = TestWriter()
+        await payload.write(writer)
+        assert len(writer.chunks) == 2
+        with open(IMAGE, "rb") as image_file:
+            assert b"".join(writer.chunks) == image_file.read()
+
+    async def test_file_decode(self):
+        path = os.path.join(os.path.dirname(__file__), "post_to_convert.json")
+        upload = Upload(path)
+        await upload.prepare()
+        with open(path, encoding="utf-8") as text_file:
+            assert upload.get_payload("application/json").decode() == text_file.read()
+
+    async def test_file_closed_on_error(self):
+        upload = Upload(IMAGE)
+        await upload.prepare()
+        opened = []
+        real_open = open
+
+        def tracking_open(*args):
+            opened.append(real_open(*args))
+            return opened[-1]
+
+        with asynctest.patch("builtins.open", side_effect=tracking_open):
+            with self.assertRaises(ConnectionResetError):
+                await upload.get_payload("image/jpeg").write(TestWriter(fail=True))
+        assert len(opened) == 1
+        assert opened[0].closed == True
+
+    async def test_memory_upload(self):
+        for image in [b"foobaz", bytearray(b"foobaz"), io.BytesIO(b"foobaz")]:
+            upload = Upload(image)
+            assert upload.in_memory == True
+            assert upload.filename == "image"
+            assert await upload.prepare() == 6
+            payload = upload.get_payload("image/jpeg")
+            assert type(payload) == BytesPayload
+            assert payload.size == 6
+
+    async def test_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            await Upload("/not/existing.jpg").prepare()